@@ -0,0 +1,263 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from billing import BillingCalculator, ProfessionalDataManager, ClientDataManager
+from client_store import normalise_cif
+from ledger import LedgerError
+from line_items import to_decimal
+from output import OUTPUT_DIR, DirectoryOutput, open_output
+
+# Manifest format
+#   JSONL: one job per line
+#     {"id": "acme-03", "title": "Web", "client_cif": "B123", "iva": 21, "irpf": 15,
+#      "invoice": true, "concepts": [{"name": "Design", "units": 10, "price": 40}]}
+#     "client" (a full client dict) may be given instead of "client_cif".
+#   CSV: one row per concept, rows sharing an id make up one job
+#     id,title,client_cif,iva,irpf,invoice,concept,units,price
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in ("1", "true", "yes", "si", "sí", "y")
+
+
+def load_jsonl_manifest(path):
+    jobs = []
+    with open(path, mode="r", encoding="utf-8") as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            # An unreadable line is one failed job (named after its line), not
+            # the end of the batch
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                job = {"invalid": f"Line {line_number}: {e}"}
+            if not isinstance(job, dict):
+                job = {"invalid": f"Line {line_number}: not a JSON object"}
+            job.setdefault("id", str(line_number))
+            jobs.append(job)
+    return jobs
+
+
+def load_csv_manifest(path):
+    jobs = {}
+    with open(path, mode="r", newline="", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            job_id = row.get("id") or str(len(jobs) + 1)
+            job = jobs.get(job_id)
+            if job is None:
+                job = {
+                    "id": job_id,
+                    "title": row.get("title", ""),
+                    "client_cif": row.get("client_cif", ""),
+                    "iva": row.get("iva") or 0,
+                    "irpf": row.get("irpf") or 0,
+                    "invoice": parse_bool(row.get("invoice")),
+                    "concepts": [],
+                }
+                jobs[job_id] = job
+            if row.get("concept"):
+                job["concepts"].append({
+                    "name": row["concept"],
+                    "units": row.get("units") or 0,
+                    "price": row.get("price") or 0,
+                })
+    return list(jobs.values())
+
+
+def load_manifest(path):
+    if path.lower().endswith(".csv"):
+        return load_csv_manifest(path)
+    return load_jsonl_manifest(path)
+
+
+def calculator_from_job(job):
+    calculator = BillingCalculator()
+    calculator.trabajo_title = job.get("title", "")
+    calculator.iva = to_decimal(job.get("iva") or 0)
+    calculator.irpf = to_decimal(job.get("irpf") or 0)
+    for concept in job.get("concepts", []):
+        calculator.lines.add(concept["name"], concept.get("units") or 0, concept.get("price") or 0)
+    return calculator
+
+
+def job_from_calculator(calculator, professional_data, client_data, include_invoice_number=True):
+    # Plain, picklable snapshot of the current budget for a worker process
+    return {
+        "title": calculator.trabajo_title,
+        "iva": str(calculator.iva),
+        "irpf": str(calculator.irpf),
+        "invoice": include_invoice_number,
+        "concepts": [
+            {"name": line.concept, "units": str(line.units), "price": str(line.price)}
+            for line in calculator.lines
+        ],
+        "professional": dict(professional_data),
+        "client": dict(client_data or {}),
+    }
+
+
+def prepare_job(job, professional_data, clients_by_cif):
+    if "invalid" in job:
+        raise ValueError(job["invalid"])
+    job = dict(job)
+    job.setdefault("professional", professional_data)
+    if "client" not in job:
+        cif = job.get("client_cif", "")
+        client = clients_by_cif.get(normalise_cif(cif))
+        if client is None:
+            raise ValueError(f"Unknown client CIF: {cif!r}")
+        job["client"] = client
+    if not job.get("invoice"):
+        job.setdefault("filename", f"budget_{job['id']}.pdf")
+    return job
+
+
+def render_job(job, output_folder=None):
+    # With an output folder the worker writes the PDF itself; without one the
+    # bytes travel back to the caller (e.g. to be streamed into an archive)
+    started = time.perf_counter()
+    result = {"id": job["id"], "invoice_number": job.get("invoice_number", ""), "filepath": None, "document_id": None}
+    calculator = None
+    try:
+        calculator = calculator_from_job(job)
+        filename, pdf = calculator.render_invoice(
+            job["professional"],
+            job["client"],
+            include_invoice_number=bool(job.get("invoice_number")),
+            invoice_number=job.get("invoice_number"),
+            filename=job.get("filename"),
+        )
+        if output_folder is None:
+            result["filename"], result["pdf"] = filename, pdf
+        else:
+            result["filepath"] = DirectoryOutput(output_folder).write(filename, pdf)
+        result["error"] = None
+    except LedgerError as e:
+        # The number may be on a document issued earlier: it stays spent
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["number_spent"] = True
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    if calculator is not None:
+        result["document_id"] = calculator.document_id
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def failed_result(job, error):
+    return {
+        "id": job["id"],
+        "invoice_number": job.get("invoice_number", ""),
+        "filepath": None,
+        "document_id": None,
+        "seconds": 0,
+        "error": error,
+    }
+
+
+def release_number(numbering, job, result):
+    # A failed job's number goes back to the allocator, together with the
+    # ledger entry recorded for it, unless recording itself failed
+    if result["error"] and job.get("invoice_number") and not result.get("number_spent"):
+        numbering.release_invoice_number(job["invoice_number"], result.get("document_id"))
+
+
+def run_batch(jobs, output, workers=None, professional_data=None, clients=None):
+    # output is a folder path or an Output; folders are written to by the
+    # workers directly, anything else receives the PDFs here, one at a time
+    if professional_data is None:
+        professional_data = ProfessionalDataManager().data
+    if clients is None:
+        clients = ClientDataManager().clients
+    # Keyed like the store, so "B-12345678" finds "B12345678"
+    clients_by_cif = {normalise_cif(client.get("CIF")): client for client in clients}
+    if isinstance(output, str):
+        output = DirectoryOutput(output)
+    folder = output.folder if isinstance(output, DirectoryOutput) else None
+    workers = workers or os.cpu_count() or 1
+
+    results = [None] * len(jobs)
+    pending = []
+    for position, job in enumerate(jobs):
+        try:
+            pending.append((position, prepare_job(job, professional_data, clients_by_cif)))
+        except ValueError as e:
+            results[position] = failed_result(job, str(e))
+
+    # The whole block of numbers is reserved in one transaction, in manifest
+    # order, never inside the workers
+    numbering = BillingCalculator()
+    invoices = [job for position, job in pending if job.get("invoice")]
+    for job, number in zip(invoices, numbering.reserve_invoice_numbers(len(invoices)) if invoices else []):
+        job["invoice_number"] = number
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Only a couple of jobs per worker are in flight, so finished PDFs
+        # waiting to be written never pile up in memory
+        remaining = iter(pending)
+        in_flight = {}
+
+        def submit_next():
+            for position, job in remaining:
+                in_flight[executor.submit(render_job, job, folder)] = (position, job)
+                return
+
+        for _ in range(workers * 2):
+            submit_next()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                position, job = in_flight.pop(future)
+                try:
+                    result = future.result()
+                    if "pdf" in result:
+                        result["filepath"] = output.write(result.pop("filename"), result.pop("pdf"))
+                except Exception as e:
+                    result = failed_result(job, f"{type(e).__name__}: {e}")
+                results[position] = result
+                release_number(numbering, job, result)
+                submit_next()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render invoices and budgets in bulk from a JSONL or CSV manifest.")
+    parser.add_argument("manifest", help="JSONL or CSV file with one job per line (CSV: one concept per row)")
+    parser.add_argument("-o", "--output", default=OUTPUT_DIR, help="folder, .zip, .tar or .tar.gz archive for the generated PDFs ('-' streams a tar to stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of render processes (default: CPU count)")
+    parser.add_argument("--report", help="write per-job results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    jobs = load_manifest(args.manifest)
+    started = time.perf_counter()
+    with open_output(args.output) as output:
+        results = run_batch(jobs, output, workers=args.workers)
+    elapsed = time.perf_counter() - started
+
+    # When the archive goes to stdout the report goes to stderr
+    log = sys.stderr if args.output == "-" else sys.stdout
+    failures = [result for result in results if result["error"]]
+    for result in results:
+        if result["error"]:
+            print(f"{result['id']}\tFAILED\t{result['error']}", file=log)
+        else:
+            print(f"{result['id']}\t{result['seconds']:.2f}s\t{result['filepath']}", file=log)
+    print(f"{len(results) - len(failures)}/{len(results)} rendered in {elapsed:.2f}s, {len(failures)} failed", file=log)
+
+    if args.report:
+        with open(args.report, mode="w", encoding="utf-8") as file:
+            json.dump({"seconds": round(elapsed, 4), "results": results}, file, indent=2)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+from billing import BillingCalculator
+from client_search import ClientSearchIndex
+from client_store import SQLiteClientStore, CLIENT_FIELDS
+from invoice_numbers import InvoiceNumberAllocator
+from renderer import InvoiceRenderer, STYLESHEETS
+
+PROFESSIONAL = {
+    "Name": "Estudio Ejemplo", "Address": "Calle Mayor 1", "CP": "08001", "CIF": "12345678Z",
+    "Phone": "600000000", "Email": "hola@example.com", "Portfolio": "example.com",
+    "IBAN": "ES00 0000 0000 0000 0000 0000", "SWIFT": "XXXXESXX",
+}
+
+FIRST_NAMES = ["Juan", "María", "José", "Ana", "Pedro", "Lucía", "Carlos", "Núria", "Jordi", "Àlex", "Sofía", "Pablo"]
+LAST_NAMES = ["García", "Martínez", "López", "Sánchez", "Pérez", "Gómez", "Peña", "Ávila", "Puig", "Ferrer", "Soler", "Vidal"]
+
+
+# Synthetic data
+
+def sample_client(index):
+    first = FIRST_NAMES[index % len(FIRST_NAMES)]
+    last = LAST_NAMES[(index // len(FIRST_NAMES)) % len(LAST_NAMES)]
+    return {
+        "Name": f"{first} {last} {index}", "Address": f"Avenida {index}", "CP": "28001",
+        "Phone": "910000000", "Email": f"cliente{index}@example.com", "CIF": f"B{index:08d}",
+    }
+
+
+def sample_calculator(index, concepts=5):
+    calculator = BillingCalculator()
+    calculator.trabajo_title = f"Proyecto {index}"
+    calculator.iva = 21
+    calculator.irpf = 15
+    for line in range(concepts):
+        calculator.lines.add(f"Concepto {line}", line % 9 + 1, f"{35 + line % 7}.50")
+    calculator.calculate_subtotal()
+    calculator.calculate_total()
+    return calculator
+
+
+def sample_html(calculator, index):
+    context = calculator.render_context(PROFESSIONAL, sample_client(index), f"2024-{index:03d}", "01/01/2024")
+    return calculator.render_html("invoice", context)
+
+
+def write_clients_csv(path, count):
+    with open(path, mode="w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=CLIENT_FIELDS)
+        writer.writeheader()
+        writer.writerows(sample_client(index) for index in range(count))
+
+
+# Measurement
+
+def timed(function, iterations, warmup=1):
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def summarise(samples, items=1):
+    mean = sum(samples) / len(samples)
+    return {
+        "iterations": len(samples),
+        "items_per_iteration": items,
+        "mean_ms": round(mean * 1000, 3),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "throughput_per_s": round(items / mean, 1) if mean else None,
+    }
+
+
+# Modules imported before the window's first frame, Flet aside
+STARTUP_MODULES = ["billing", "batch", "render_queue", "output", "client_search", "line_items"]
+# Must stay out of startup; they load on the first render or in the prewarm
+DEFERRED_MODULES = ["weasyprint", "jinja2"]
+
+
+# Stages: each returns (samples, items handled per sample)
+
+def bench_calculate(args, workdir):
+    calculator = sample_calculator(0, args.concepts)
+    lines = calculator.lines.items
+
+    def reprice():
+        for line in lines:
+            calculator.lines.set(line.concept, line.units, line.price + 1)
+        calculator.calculate_subtotal()
+        calculator.calculate_total()
+    return timed(reprice, args.iterations), args.concepts
+
+
+def bench_template(args, workdir):
+    calculator = sample_calculator(0, args.concepts)
+    return timed(lambda: sample_html(calculator, 0), args.iterations), 1
+
+
+def bench_pdf(args, workdir):
+    html = sample_html(sample_calculator(0, args.concepts), 0)
+    renderer = InvoiceRenderer()
+    return timed(lambda: renderer.render(html), args.pdf_iterations), 1
+
+
+def bench_pdf_chunked(args, workdir):
+    # Same invoice as "pdf", laid out a chunk of concepts at a time
+    calculator = sample_calculator(0, args.concepts)
+    calculator.use_render_cache = False
+    context = calculator.render_context(PROFESSIONAL, sample_client(0), "2024-000", "01/01/2024")
+    return timed(lambda: calculator.render_pdf("invoice", context), args.pdf_iterations), 1
+
+
+def bench_pdf_unshared(args, workdir):
+    # What every render did before InvoiceRenderer: parse the stylesheet and
+    # resolve fonts from scratch
+    from weasyprint import HTML, CSS
+    html = sample_html(sample_calculator(0, args.concepts), 0)
+    css_text = "".join(open(path, encoding="utf-8").read() for path in STYLESHEETS)
+    return timed(lambda: HTML(string=html).write_pdf(stylesheets=[CSS(string=css_text)]), args.pdf_iterations), 1
+
+
+def bench_startup(args, workdir):
+    # A fresh interpreter each time, so this includes Python's own start-up
+    code = (
+        f"import sys, {', '.join(STARTUP_MODULES)}\n"
+        f"loaded = [name for name in {DEFERRED_MODULES!r} if name in sys.modules]\n"
+        "sys.exit(f'imported at startup: {loaded}' if loaded else 0)"
+    )
+    command = [sys.executable, "-c", code]
+    folder = os.path.dirname(os.path.abspath(__file__))
+    return timed(lambda: subprocess.run(command, cwd=folder, check=True), max(1, args.iterations // 20)), 1
+
+
+def bench_clients_csv(args, workdir):
+    path = os.path.join(workdir, "clients.csv")
+    write_clients_csv(path, args.clients)
+
+    def load():
+        with open(path, mode="r", newline="") as file:
+            return [row for row in csv.DictReader(file)]
+    return timed(load, max(1, args.iterations // 10)), args.clients
+
+
+def bench_clients_store(args, workdir):
+    path = os.path.join(workdir, "clients.csv")
+    if not os.path.exists(path):
+        write_clients_csv(path, args.clients)
+    store = SQLiteClientStore(os.path.join(workdir, "clients.sqlite3"))
+    store.import_csv(path)
+    samples = timed(store.all, max(1, args.iterations // 10))
+    store.close()
+    return samples, args.clients
+
+
+def bench_client_search(args, workdir):
+    index = ClientSearchIndex()
+    index.build((number, sample_client(number)) for number in range(args.clients))
+    queries = ["a", "pe", "pena", "garcia lopez", "b0000123", "cliente42", "nuria"]
+    return timed(lambda: [index.search(query, 8) for query in queries], args.iterations), len(queries)
+
+
+def bench_numbering(args, workdir):
+    allocator = InvoiceNumberAllocator(os.path.join(workdir, "counter.sqlite3"), legacy_file=None)
+    return timed(allocator.allocate, args.iterations), 1
+
+
+STAGES = {
+    "startup": bench_startup,
+    "calculate": bench_calculate,
+    "template": bench_template,
+    "pdf": bench_pdf,
+    "pdf_chunked": bench_pdf_chunked,
+    "pdf_unshared": bench_pdf_unshared,
+    "clients_csv": bench_clients_csv,
+    "clients_store": bench_clients_store,
+    "client_search": bench_client_search,
+    "numbering": bench_numbering,
+}
+
+
+def run_stage(name, args, workdir):
+    # Runs in a fresh interpreter, so peak RSS is this stage's own (Python and
+    # the imports included) and not the high-water mark of every stage before it
+    samples, items = STAGES[name](args, workdir)
+    return dict(summarise(samples, items), peak_rss_mb=peak_rss_mb())
+
+
+def run(args):
+    results = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            "clients": args.clients,
+            "concepts": args.concepts,
+            "iterations": args.iterations,
+            "pdf_iterations": args.pdf_iterations,
+        },
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in args.stages:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                results["stages"][name] = executor.submit(run_stage, name, args, workdir).result()
+    results["peak_rss_mb"] = max((stage["peak_rss_mb"] for stage in results["stages"].values()), default=0)
+    return results
+
+
+def print_results(results, baseline=None):
+    print(f"{'stage':<15}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'items/s':>12}{'rss MB':>9}" + ("   vs baseline p50" if baseline else ""))
+    for name, stage in results["stages"].items():
+        line = f"{name:<15}{stage['p50_ms']:>10.3f}{stage['p95_ms']:>10.3f}{stage['p99_ms']:>10.3f}{stage['throughput_per_s']:>12.1f}{stage['peak_rss_mb']:>9.1f}"
+        previous = (baseline or {}).get("stages", {}).get(name)
+        if previous and previous["p50_ms"]:
+            change = (stage["p50_ms"] - previous["p50_ms"]) / previous["p50_ms"] * 100
+            line += f"   {change:+.1f}%"
+        print(line)
+    print(f"peak RSS (largest stage): {results['peak_rss_mb']} MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the billing and rendering pipeline on synthetic data, without the GUI.")
+    parser.add_argument("-n", "--clients", type=int, default=10000, help="synthetic clients for the client stages")
+    parser.add_argument("-c", "--concepts", type=int, default=50, help="concepts per synthetic invoice")
+    parser.add_argument("-i", "--iterations", type=int, default=200, help="samples per fast stage")
+    parser.add_argument("--pdf-iterations", type=int, default=20, help="samples per PDF stage")
+    parser.add_argument("-s", "--stages", nargs="+", choices=list(STAGES), default=list(STAGES))
+    parser.add_argument("-o", "--output", help="save the results as JSON")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, mode="w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+import bisect
+import csv
+from datetime import datetime
+import os
+import sqlite3
+from invoice_numbers import get_allocator
+from line_items import LineItems, ZERO, tax_amount, to_decimal
+from client_store import SQLiteClientStore, CLIENT_FIELDS
+from template_registry import get_template
+from renderer import get_renderer
+from render_cache import get_render_cache
+from output import Output, DirectoryOutput
+from ledger import LedgerError, get_ledger
+from bulk_io import import_clients, export_clients
+from instrumentation import span, capture, timed
+
+class BillingCalculator:
+    def __init__(self):
+        self.trabajo_title = ""
+        self.lines = LineItems()
+        self.subtotal = ZERO
+        self.iva_amount = ZERO
+        self.irpf_amount = ZERO
+        self.total = ZERO
+        self.irpf = 0
+        self.iva = 0
+        self.invoice_counter_file = "invoice_counter.json"
+        self.invoice_counter_db = "invoice_counter.sqlite3"
+        self.use_render_cache = True
+        # Every rendered invoice and budget is kept in the ledger for reports
+        # and to render it again later
+        self.ledger_db = "ledger.sqlite3"
+        self.record_in_ledger = True
+        # Ledger id of the last document render_invoice() recorded
+        self.document_id = None
+        # Invoices longer than the first page are laid out in chunks of rows;
+        # a chunk must run past the end of its page (see render_chunks)
+        self.paginate = True
+        self.first_page_lines = 25
+        self.page_lines = 45
+
+    def calculate_subtotal(self):
+        self.subtotal = self.lines.subtotal()
+
+    def calculate_total(self):
+        # Each tax is rounded to the cent once, then added; what the PDF shows adds up
+        self.iva_amount = tax_amount(self.subtotal, self.iva)
+        self.irpf_amount = tax_amount(self.subtotal, self.irpf)
+        self.total = self.subtotal + self.iva_amount - self.irpf_amount
+
+
+    def add_service(self, service):
+        # A catalogue entry as a new line, with its default units and price.
+        # Its IVA/IRPF rules only fill in rates the budget does not have yet.
+        item = self.lines.add(service["name"], service["units"], service["price"])
+        if service.get("iva") and not self.iva:
+            self.iva = to_decimal(service["iva"])
+        if service.get("irpf") and not self.irpf:
+            self.irpf = to_decimal(service["irpf"])
+        return item
+
+    @property
+    def invoice_numbers(self):
+        return get_allocator(self.invoice_counter_db, self.invoice_counter_file)
+
+    def generate_invoice_number(self):
+        return self.invoice_numbers.allocate()
+
+    def reserve_invoice_numbers(self, count):
+        return self.invoice_numbers.reserve(count)
+
+    def release_invoice_number(self, invoice_number, document_id=None):
+        # Nothing with this number reached the user; the document recorded for
+        # it (if any) leaves the ledger and the reports before the number can
+        # be handed out again
+        if document_id is not None:
+            self.ledger.forget(document_id)
+        self.invoice_numbers.release(invoice_number)
+
+    def get_current_date(self):
+        return datetime.now().strftime("%d/%m/%Y")
+
+    @property
+    def ledger(self):
+        return get_ledger(self.ledger_db)
+
+
+    def render_context(self, professional_data, client_data, invoice_number="", current_date=""):
+        return dict(
+            professional_data=professional_data,
+            client_data=client_data,
+            trabajo_title=self.trabajo_title,
+            lines=self.lines,
+            subtotal=self.subtotal,
+            irpf=self.irpf,
+            iva=self.iva,
+            iva_amount=self.iva_amount,
+            irpf_amount=self.irpf_amount,
+            total=self.total,
+            invoice_number=invoice_number,
+            current_date=current_date,
+            line_offset=0,
+            first_chunk=True,
+            last_chunk=True,
+        )
+
+    def chunk_context(self, context, lines, start, end):
+        # Rows [start, end) of the concept list; the header only goes in the
+        # first chunk and the totals in the last
+        return dict(context, lines=lines[start:end], line_offset=start, first_chunk=start == 0, last_chunk=end == len(lines))
+
+    def render_html(self, template_name, context):
+        template = get_template(template_name)
+        with span("template.render", template=template_name):
+            return template.render(**context)
+
+    def render_pdf(self, template_name, context, cacheable=False):
+        # Budgets carry no number, so re-rendering an unchanged one is served from
+        # the cache; the date is left out of the key on purpose. Invoices always
+        # have a new number and are never cached.
+        cache = get_render_cache() if cacheable and self.use_render_cache else None
+        if cache is not None:
+            with span("render_cache.lookup"):
+                key = cache.key(template_name, context, ignore=("current_date", "invoice_number"))
+                pdf = cache.get(key)
+            if pdf is not None:
+                return pdf
+        lines = list(context["lines"])
+        if not self.paginate or len(lines) <= self.first_page_lines:
+            pdf = get_renderer().render(self.render_html(template_name, context))
+        else:
+            # Templates are rendered one chunk at a time as the renderer asks for them
+            pdf = get_renderer().render_chunks(
+                lambda start, end: self.render_html(template_name, self.chunk_context(context, lines, start, end)),
+                len(lines), self.first_page_lines, self.page_lines,
+            )
+        if cache is not None:
+            cache.put(key, pdf)
+        return pdf
+
+    def render_invoice(self, professional_data, client_data, include_invoice_number=True, invoice_number=None, filename=None, issued=None):
+        # Returns (filename, PDF bytes) without touching the disk. issued (a
+        # date) replaces today's date, to reproduce a past document.
+        with capture("render_invoice"), span("invoice"):
+            with span("invoice.totals"):
+                self.calculate_subtotal()
+                self.calculate_total()
+
+            # Batch runs allocate numbers up front so workers never touch the counter
+            if invoice_number:
+                include_invoice_number = True
+            elif include_invoice_number:
+                with span("invoice.number"):
+                    invoice_number = self.generate_invoice_number()
+            else:
+                invoice_number = ""
+            current_date = issued.strftime("%d/%m/%Y") if issued else self.get_current_date()
+
+            kind = "invoice" if include_invoice_number else "budget"
+            context = self.render_context(professional_data, client_data, invoice_number, current_date)
+            pdf = self.render_pdf(kind, context, cacheable=not include_invoice_number)
+
+            self.document_id = None
+            if self.record_in_ledger:
+                with span("invoice.record"):
+                    try:
+                        self.document_id = self.ledger.record(kind, context, issued)
+                    except sqlite3.Error as e:
+                        raise LedgerError(f"Could not record {invoice_number or 'the budget'} in the ledger: {e}") from e
+
+        if not filename:
+            filename = f"invoice_{invoice_number if include_invoice_number else 'sin_numero'}.pdf"
+        return filename, pdf
+
+    def generate_invoice(self, output, professional_data, client_data, include_invoice_number=True, invoice_number=None, filename=None, issued=None):
+        # output is a folder path or any Output (memory buffer, zip or tar archive)
+        filename, pdf = self.render_invoice(professional_data, client_data, include_invoice_number, invoice_number, filename, issued)
+        if not isinstance(output, Output):
+            output = DirectoryOutput(output)
+        with span("invoice.write"):
+            return output.write(filename, pdf)
+
+class ProfessionalDataManager:
+    def __init__(self):
+        self.fields = ["Name", "Address", "CP", "CIF", "Phone", "Email", "Portfolio", "IBAN", "SWIFT"]
+        self.data = {field: "" for field in self.fields}
+        self.file_path = "professional_data.csv"
+        self.load_data()
+
+    @timed("professional.load")
+    def load_data(self):
+        if os.path.exists(self.file_path):
+            with open(self.file_path, mode="r") as file:
+                reader = csv.DictReader(file)
+                for row in reader:
+                    self.data.update(row)
+
+    @timed("professional.save")
+    def save_data(self):
+        with open(self.file_path, mode="w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=self.fields)
+            writer.writeheader()
+            writer.writerow(self.data)
+
+class ClientDataManager:
+    def __init__(self, load=True):
+        self.fields = list(CLIENT_FIELDS)
+        # Store id -> client, the only way views refer to a client
+        self.clients_by_id = {}
+        # Alphabetical view, kept sorted on every change instead of re-sorted
+        self.sorted_clients = []
+        self.sort_keys = []
+        self.current_client = {}
+        self.file_path = "clients_data.csv"
+        self.db_path = "clients_data.sqlite3"
+        self.store = SQLiteClientStore(self.db_path, self.fields)
+        # The GUI passes load=False and calls load_clients() off the UI thread
+        if load:
+            self.load_clients()
+
+    @property
+    def clients(self):
+        return list(self.clients_by_id.values())
+
+    @staticmethod
+    def sort_key(client):
+        return (client["Name"].lower(), client["id"])
+
+    @timed("clients.load")
+    def load_clients(self):
+        self.store.import_csv(self.file_path)
+        self.clients_by_id = {client["id"]: client for client in self.store.all()}
+        self.sorted_clients = sorted(self.clients_by_id.values(), key=self.sort_key)
+        self.sort_keys = [self.sort_key(client) for client in self.sorted_clients]
+
+    def sorted_position(self, client_id):
+        client = self.clients_by_id.get(client_id)
+        if client is None:
+            return None
+        return bisect.bisect_left(self.sort_keys, self.sort_key(client))
+
+    def _unlink_sorted(self, client):
+        position = bisect.bisect_left(self.sort_keys, self.sort_key(client))
+        del self.sort_keys[position]
+        del self.sorted_clients[position]
+
+    @timed("clients.save")
+    def add_client(self, client_data):
+        # Saving a client whose CIF is already stored updates that client
+        client = self.store.get(self.store.save(client_data))
+        previous = self.clients_by_id.get(client["id"])
+        if previous is not None:
+            self._unlink_sorted(previous)
+        self.clients_by_id[client["id"]] = client
+        position = bisect.bisect_left(self.sort_keys, self.sort_key(client))
+        self.sort_keys.insert(position, self.sort_key(client))
+        self.sorted_clients.insert(position, client)
+        self.current_client = client
+        return client
+
+    def update_client(self, client_id, client_data):
+        return self.add_client(dict(client_data, id=client_id))
+
+    @timed("clients.delete")
+    def delete_client(self, client_id):
+        # The store first: if it fails, both views still show the client
+        if not self.store.delete(client_id):
+            return False
+        client = self.clients_by_id.pop(client_id, None)
+        if client is not None:
+            self._unlink_sorted(client)
+        if self.current_client.get("id") == client_id:
+            self.current_client = {}
+        return True
+
+    @timed("clients.import")
+    def import_file(self, path):
+        # Bulk import (CSV or JSONL), validated and deduplicated by CIF; returns the ImportReport
+        report = import_clients(self.store, path)
+        self.load_clients()
+        return report
+
+    @timed("clients.export")
+    def export_file(self, path):
+        return export_clients(self.store, path)
+
+    @timed("clients.export")
+    def save_clients(self):
+        # Clients are written to the store as they change; this exports a CSV copy
+        self.store.export_csv(self.file_path)
+
+    def select_client(self, client_id):
+        client = self.clients_by_id.get(client_id)
+        if client is not None:
+            self.current_client = client
+        return client
@@ -0,0 +1,246 @@
+import argparse
+import csv
+import json
+import re
+import sys
+from itertools import islice
+
+from client_store import SQLiteClientStore, CLIENT_FIELDS, normalise_cif
+from line_items import money, quantity
+
+# Formats
+#   CSV: header row with the field names (any case); ",", ";" or tab
+#     delimited. Spreadsheet exports (Excel, Numbers, LibreOffice, XLSX saved
+#     as CSV) usually start with a UTF-8 BOM, which is skipped.
+#   JSONL: one object per line with the field names as keys.
+# Files are read and written one row at a time, so size is not a concern.
+
+# At most SQLite's default limit of host parameters per IN (...) query
+CHUNK_SIZE = 500
+CONCEPT_COLUMNS = ["concept", "units", "price"]
+EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.duplicates = 0
+        # (line number, message)
+        self.errors = []
+
+    def __str__(self):
+        return (
+            f"{self.rows} rows: {self.inserted} new, {self.updated} updated, "
+            f"{self.duplicates} duplicates in the file, {len(self.errors)} errors"
+        )
+
+
+def file_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return "jsonl" if path.lower().endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def open_text(path, mode):
+    # "-" is stdin/stdout
+    if path == "-":
+        return sys.stdin if mode == "r" else sys.stdout
+    return open(path, mode=mode, newline="", encoding="utf-8-sig" if mode == "r" else "utf-8")
+
+
+def read_csv(file, fallback=None):
+    sample = file.read(8192)
+    if file.seekable():
+        file.seek(0)
+        lines = file
+    else:
+        lines = _chain(sample, file)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    rows = csv.reader(lines, dialect)
+    first = next(rows, None)
+    if first is None:
+        return
+    header = [column.strip() for column in first]
+    if fallback and not {column.lower() for column in header} & {field.lower() for field in fallback}:
+        # No header row: the columns are in the fallback order
+        header = list(fallback)
+        yield 1, dict(zip(header, first))
+    for line_number, values in enumerate(rows, 2):
+        if any(value.strip() for value in values):
+            yield line_number, dict(zip(header, values))
+
+
+def _chain(sample, file):
+    # Puts the sniffed sample back in front of an unseekable stream
+    lines = sample.splitlines(keepends=True)
+    if lines and not lines[-1].endswith(("\n", "\r")):
+        lines[-1] += file.readline()
+    yield from lines
+    yield from file
+
+
+def read_jsonl(file):
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, e
+            continue
+        yield line_number, row if isinstance(row, dict) else ValueError("Not a JSON object")
+
+
+def read_rows(file, fmt, fallback=None):
+    # (line number, dict) pairs; a ValueError instead of the dict marks an
+    # unreadable line. fallback names the CSV columns when there is no header.
+    return read_jsonl(file) if fmt == "jsonl" else read_csv(file, fallback)
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Clients
+
+def clean_client(row, fields=CLIENT_FIELDS):
+    # Returns the client with exactly the schema's fields, or raises ValueError
+    if isinstance(row, Exception):
+        raise ValueError(str(row))
+    by_name = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+    client = {field: str(by_name.get(field.lower()) or "").strip() for field in fields}
+    if "Name" in client and not client["Name"]:
+        raise ValueError("Missing Name")
+    if client.get("CIF"):
+        client["CIF"] = normalise_cif(client["CIF"])
+    if client.get("Email") and not EMAIL.match(client["Email"]):
+        raise ValueError(f"Invalid Email: {client['Email']!r}")
+    return client
+
+
+def import_clients(store, path, fmt=None, chunk_size=CHUNK_SIZE):
+    # Validates every row, keeps the last row for each CIF within a chunk and
+    # writes each chunk in one transaction. Clients whose CIF is already in
+    # the store (including earlier chunks) are updated in place.
+    report = ImportReport()
+    with open_text(path, "r") as file:
+        for chunk in chunks(read_rows(file, file_format(path, fmt), store.fields), chunk_size):
+            valid = {}
+            for line_number, row in chunk:
+                report.rows += 1
+                try:
+                    client = clean_client(row, store.fields)
+                except ValueError as e:
+                    report.errors.append((line_number, str(e)))
+                    continue
+                key = client.get("CIF") or ("line", line_number)
+                if key in valid:
+                    report.duplicates += 1
+                    del valid[key]
+                valid[key] = client
+            existing = store.existing_cifs(client.get("CIF") for client in valid.values())
+            store.save_many(valid.values())
+            report.updated += len(existing)
+            report.inserted += len(valid) - len(existing)
+    return report
+
+
+def export_clients(store, path, fmt=None, delimiter=",", batch_size=CHUNK_SIZE):
+    count = 0
+    fmt = file_format(path, fmt)
+    with open_text(path, "w") as file:
+        if fmt == "jsonl":
+            for client in store.iter_all(batch_size):
+                client.pop("id")
+                file.write(json.dumps(client, ensure_ascii=False) + "\n")
+                count += 1
+        else:
+            writer = csv.DictWriter(file, fieldnames=store.fields, delimiter=delimiter, extrasaction="ignore")
+            writer.writeheader()
+            for client in store.iter_all(batch_size):
+                writer.writerow(client)
+                count += 1
+    return count
+
+
+# Concepts
+
+def read_concepts(path, fmt=None):
+    # Same result as line_items.parse_concepts: ([(concept, units, price)],
+    # [(line number, error)]), ready for LineItems.add_many(). CSV columns are
+    # matched by name (concept or name, units, price); files without a header
+    # are read in that order.
+    rows = []
+    errors = []
+    fmt = file_format(path, fmt)
+    with open_text(path, "r") as file:
+        for line_number, row in read_rows(file, fmt, CONCEPT_COLUMNS):
+            if isinstance(row, Exception):
+                errors.append((line_number, str(row)))
+                continue
+            try:
+                rows.append(clean_concept(row))
+            except ValueError as e:
+                errors.append((line_number, str(e)))
+    return rows, errors
+
+
+def clean_concept(row):
+    by_name = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+    concept = str(by_name.get("concept") or by_name.get("name") or "").strip()
+    if not concept:
+        raise ValueError("Missing concept")
+    return concept, quantity(by_name.get("units") or 0), money(by_name.get("price") or 0)
+
+
+def export_concepts(lines, path, fmt=None, delimiter=";"):
+    # lines is a LineItems (or any iterable of LineItem)
+    fmt = file_format(path, fmt)
+    with open_text(path, "w") as file:
+        if fmt == "jsonl":
+            for line in lines:
+                file.write(json.dumps({"concept": line.concept, "units": str(line.units), "price": str(line.price)}, ensure_ascii=False) + "\n")
+        else:
+            writer = csv.writer(file, delimiter=delimiter)
+            writer.writerow(CONCEPT_COLUMNS)
+            writer.writerows((line.concept, line.units, line.price) for line in lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import or export clients as CSV or JSONL, streaming row by row.")
+    parser.add_argument("--db", default="clients_data.sqlite3", help="client database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="validate, deduplicate by CIF and store clients")
+    importer.add_argument("path", help="CSV or JSONL file ('-' reads stdin)")
+    exporter = commands.add_parser("export", help="write every client")
+    exporter.add_argument("path", help="CSV or JSONL file ('-' writes stdout)")
+    exporter.add_argument("--delimiter", default=",", help="CSV delimiter (';' for spreadsheets in Spanish locales)")
+    for command in (importer, exporter):
+        command.add_argument("--format", choices=["csv", "jsonl"], help="default: from the file extension")
+    args = parser.parse_args(argv)
+
+    store = SQLiteClientStore(args.db)
+    if args.command == "import":
+        report = import_clients(store, args.path, args.format)
+        for line_number, error in report.errors:
+            print(f"line {line_number}: {error}", file=sys.stderr)
+        print(report, file=sys.stderr)
+        store.close()
+        sys.exit(1 if report.errors else 0)
+    count = export_clients(store, args.path, args.format, args.delimiter)
+    print(f"{count} clients exported", file=sys.stderr)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
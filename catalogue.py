@@ -0,0 +1,192 @@
+import argparse
+import sqlite3
+import sys
+import threading
+from functools import lru_cache
+
+from client_search import PrefixIndex, normalise, tokenize
+from line_items import money, quantity, to_decimal
+
+SERVICE_FIELDS = ["name", "price", "units", "unit", "iva", "irpf"]
+
+
+def tax_rule(value):
+    # "" leaves the budget's rate alone; anything else is a rate in percent
+    if not str(value or "").strip():
+        return ""
+    return format(to_decimal(value).normalize(), "f")
+
+
+class Catalogue:
+    # Services billed again and again, with a default price and units and,
+    # optionally, the IVA/IRPF rates they are billed with ("" = no rule).
+    # The whole catalogue (a few hundred entries) lives in memory with a
+    # sorted token index, so autocomplete never touches the database.
+    def __init__(self, db_path="catalogue.sqlite3", load=True):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.create_tables()
+        # id -> service
+        self.services = {}
+        # Name tokens -> ids, the same prefix index the client search uses
+        self.tokens = PrefixIndex()
+        # Same query, same answer until the catalogue changes
+        self.matches = lru_cache(maxsize=512)(self.find)
+        if load:
+            self.load()
+
+    def __len__(self):
+        return len(self.services)
+
+    def create_tables(self):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS services ("
+                "id INTEGER PRIMARY KEY, "
+                "name TEXT NOT NULL UNIQUE COLLATE NOCASE, "
+                "price TEXT NOT NULL DEFAULT '0.00', "
+                "units TEXT NOT NULL DEFAULT '1', "
+                "unit TEXT NOT NULL DEFAULT '', "
+                "iva TEXT NOT NULL DEFAULT '', "
+                "irpf TEXT NOT NULL DEFAULT '', "
+                # How often it was added to a budget; the most used come first
+                "uses INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    def load(self):
+        with self.lock:
+            rows = self.connection.execute("SELECT * FROM services").fetchall()
+        self.services = {row["id"]: dict(row) for row in rows}
+        self.reindex()
+
+    def reindex(self):
+        self.tokens.build((token, service_id) for service_id, service in self.services.items() for token in set(tokenize(service["name"])))
+        self.matches.cache_clear()
+
+    @staticmethod
+    def clean(service):
+        name = " ".join(str(service.get("name") or "").split())
+        if not name:
+            raise ValueError("Missing name")
+        return {
+            "name": name,
+            "price": str(money(service.get("price") or 0)),
+            "units": str(quantity(service.get("units") or 1)),
+            "unit": str(service.get("unit") or "").strip(),
+            "iva": tax_rule(service.get("iva")),
+            "irpf": tax_rule(service.get("irpf")),
+        }
+
+    def _save(self, service):
+        # Caller holds the lock and the transaction; a known name (any case) is updated
+        values = self.clean(service)
+        self.connection.execute(
+            f"INSERT INTO services ({', '.join(SERVICE_FIELDS)}) VALUES ({', '.join('?' for _ in SERVICE_FIELDS)}) "
+            "ON CONFLICT(name) DO UPDATE SET " + ", ".join(f"{field} = excluded.{field}" for field in SERVICE_FIELDS),
+            [values[field] for field in SERVICE_FIELDS],
+        )
+        return self.connection.execute("SELECT * FROM services WHERE name = ?", (values["name"],)).fetchone()
+
+    def save(self, service):
+        with self.lock, self.connection:
+            row = self._save(service)
+        saved = self.services[row["id"]] = dict(row)
+        self.reindex()
+        return saved
+
+    def save_many(self, services):
+        with self.lock, self.connection:
+            rows = [self._save(service) for service in services]
+        self.services.update((row["id"], dict(row)) for row in rows)
+        self.reindex()
+        return len(rows)
+
+    def delete(self, service_id):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM services WHERE id = ?", (service_id,))
+        if self.services.pop(service_id, None) is not None:
+            self.reindex()
+
+    def get(self, service_id):
+        return self.services.get(service_id)
+
+    def used(self, service_id):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE services SET uses = uses + 1 WHERE id = ?", (service_id,))
+        self.services[service_id]["uses"] += 1
+        self.matches.cache_clear()
+
+    def find(self, query):
+        # Every word of the query must start a word of the name, in any order:
+        # "web dis" finds "Diseño web". Returns ids, most used first.
+        tokens = tokenize(query)
+        if tokens:
+            ids = self.tokens.matches(tokens[0])
+            for token in tokens[1:]:
+                ids &= self.tokens.matches(token)
+        else:
+            ids = self.services.keys()
+        return tuple(sorted(ids, key=lambda service_id: (-self.services[service_id]["uses"], normalise(self.services[service_id]["name"]))))
+
+    def search(self, query, limit=8):
+        return [self.services[service_id] for service_id in self.matches(normalise(query).strip())[:limit]]
+
+    def close(self):
+        self.connection.close()
+
+
+def main(argv=None):
+    from bulk_io import read_rows, file_format, open_text
+
+    parser = argparse.ArgumentParser(description="Manage the catalogue of services offered when adding concepts.")
+    parser.add_argument("--db", default="catalogue.sqlite3", help="catalogue database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    lister = commands.add_parser("list", help="list services, optionally matching a search")
+    lister.add_argument("query", nargs="?", default="")
+    adder = commands.add_parser("add", help="add or update a service")
+    adder.add_argument("name")
+    adder.add_argument("--price", default="0")
+    adder.add_argument("--units", default="1")
+    adder.add_argument("--unit", default="")
+    adder.add_argument("--iva", default="")
+    adder.add_argument("--irpf", default="")
+    remover = commands.add_parser("remove", help="remove a service by name")
+    remover.add_argument("name")
+    importer = commands.add_parser("import", help="add or update services from CSV or JSONL (name, price, units, unit, iva, irpf)")
+    importer.add_argument("path")
+    args = parser.parse_args(argv)
+
+    catalogue = Catalogue(args.db)
+    if args.command == "list":
+        for service in catalogue.search(args.query, limit=len(catalogue)):
+            rates = " ".join(f"{tax.upper()} {service[tax]}%" for tax in ("iva", "irpf") if service[tax])
+            print(f"{service['name']:<40}{service['units']:>6} {service['unit']:<6}{service['price']:>10}€  {rates}")
+    elif args.command == "add":
+        catalogue.save(vars(args))
+    elif args.command == "remove":
+        matches = [service for service in catalogue.services.values() if service["name"].lower() == args.name.lower()]
+        for service in matches:
+            catalogue.delete(service["id"])
+        if not matches:
+            sys.exit(f"No service called {args.name!r}")
+    else:
+        services, errors = [], []
+        with open_text(args.path, "r") as file:
+            for line_number, row in read_rows(file, file_format(args.path), SERVICE_FIELDS):
+                try:
+                    if isinstance(row, Exception):
+                        raise row
+                    services.append(Catalogue.clean({str(key).strip().lower(): value for key, value in row.items() if key is not None}))
+                except ValueError as e:
+                    errors.append((line_number, str(e)))
+        catalogue.save_many(services)
+        for line_number, error in errors:
+            print(f"line {line_number}: {error}", file=sys.stderr)
+        print(f"{len(services)} services imported, {len(errors)} errors", file=sys.stderr)
+    catalogue.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import bisect
+import heapq
+import re
+import unicodedata
+from collections import Counter
+from itertools import chain
+
+SEARCH_FIELDS = ("Name", "CIF", "Email")
+TOKEN_SPLIT = re.compile(r"[^0-9a-z]+")
+COMBINING_MARKS = re.compile(r"[\u0300-\u036f]")
+
+
+def normalise(text):
+    # "Peña Ávila" -> "pena avila"
+    text = str(text or "")
+    if text.isascii():
+        return text.lower()
+    return COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", text)).casefold()
+
+
+def tokenize(text):
+    return [token for token in TOKEN_SPLIT.split(normalise(text)) if token]
+
+
+def trigrams(token):
+    # Padded so that word starts and ends count: "ana" -> " an", "ana", "na "
+    token = f" {token} "
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class PrefixIndex:
+    # Parallel sorted lists of (token, key); the keys whose tokens start with
+    # a prefix are a contiguous slice, found with two bisections
+    def __init__(self):
+        self.token_list = []
+        self.key_list = []
+
+    def build(self, pairs):
+        # Bulk load from (token, key) pairs: one sort instead of an insert each
+        pairs = sorted(pairs)
+        self.token_list = [token for token, key in pairs]
+        self.key_list = [key for token, key in pairs]
+
+    def add(self, key, tokens):
+        for token in tokens:
+            position = bisect.bisect_right(self.token_list, token)
+            self.token_list.insert(position, token)
+            self.key_list.insert(position, key)
+
+    def remove(self, key, tokens):
+        for token in tokens:
+            start = bisect.bisect_left(self.token_list, token)
+            end = bisect.bisect_right(self.token_list, token)
+            position = self.key_list.index(key, start, end)
+            del self.token_list[position]
+            del self.key_list[position]
+
+    def matches(self, prefix):
+        start = bisect.bisect_left(self.token_list, prefix)
+        end = bisect.bisect_left(self.token_list, prefix + "\uffff", start)
+        return set(self.key_list[start:end])
+
+
+class ClientSearchIndex:
+    def __init__(self, fields=SEARCH_FIELDS):
+        self.fields = fields
+        self.tokens = PrefixIndex()
+        # Sorted (normalised name, key): a query that starts a name is answered
+        # straight from here, already in display order
+        self.name_list = []
+        # key -> normalised name, the ranking key
+        self.names = {}
+        # key -> tokens, needed to take a record out again
+        self.record_tokens_by_key = {}
+        # trigram -> keys, only over names, for the typo-tolerant fallback;
+        # built the first time a query needs it
+        self.trigrams = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def record_tokens(self, client):
+        # Returns the normalised name and every searchable token of a client
+        name = ""
+        tokens = set()
+        for field in self.fields:
+            value = normalise(client.get(field, ""))
+            if field == "Name":
+                name = value
+            tokens.update(TOKEN_SPLIT.split(value))
+            # The whole CIF or e-mail, so "b123" and "ana@acme" match as typed
+            tokens.add(value.replace(" ", ""))
+        tokens.discard("")
+        return name, tokens
+
+    def name_trigrams(self, name):
+        grams = set()
+        for token in TOKEN_SPLIT.split(name):
+            if token:
+                grams |= trigrams(token)
+        return grams
+
+    def build(self, items):
+        pairs = []
+        self.names = {}
+        self.record_tokens_by_key = {}
+        self.trigrams = None
+        for key, client in items:
+            name, tokens = self.record_tokens(client)
+            self.names[key] = name
+            self.record_tokens_by_key[key] = tokens
+            pairs.extend((token, key) for token in tokens)
+        self.tokens.build(pairs)
+        self.name_list = sorted((name, key) for key, name in self.names.items())
+
+    def add(self, key, client):
+        if key in self.names:
+            self.remove(key)
+        name, tokens = self.record_tokens(client)
+        self.names[key] = name
+        self.record_tokens_by_key[key] = tokens
+        self.tokens.add(key, tokens)
+        bisect.insort(self.name_list, (name, key))
+        if self.trigrams is not None:
+            for gram in self.name_trigrams(name):
+                self.trigrams.setdefault(gram, []).append(key)
+
+    def remove(self, key):
+        name = self.names.pop(key, None)
+        if name is None:
+            return
+        self.tokens.remove(key, self.record_tokens_by_key.pop(key))
+        del self.name_list[bisect.bisect_left(self.name_list, (name, key))]
+        for gram in self.name_trigrams(name) if self.trigrams is not None else ():
+            keys = self.trigrams[gram]
+            keys.remove(key)
+            if not keys:
+                del self.trigrams[gram]
+
+    def name_prefix_matches(self, prefix, limit):
+        start = bisect.bisect_left(self.name_list, (prefix,))
+        matches = []
+        for name, key in self.name_list[start:start + limit]:
+            if not name.startswith(prefix):
+                break
+            matches.append(key)
+        return matches
+
+    def build_trigrams(self):
+        # Safe to run in a background thread: searches see either no trigram
+        # index or the complete one
+        index = {}
+        for key, name in list(self.names.items()):
+            for gram in self.name_trigrams(name):
+                index.setdefault(gram, []).append(key)
+        self.trigrams = index
+
+    def fuzzy_matches(self, query_tokens):
+        grams = set()
+        for token in query_tokens:
+            grams |= trigrams(token)
+        if not grams:
+            return {}
+        if self.trigrams is None:
+            self.build_trigrams()
+        hits = Counter(chain.from_iterable(self.trigrams.get(gram, ()) for gram in grams))
+        needed = max(1, len(grams) // 2)
+        return {key: count for key, count in hits.items() if count >= needed}
+
+    def search(self, query, limit=10):
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+        # Names starting with the query rank first and come out already sorted
+        results = self.name_prefix_matches(normalise(query).strip(), limit)
+        if len(results) == limit:
+            return results
+        candidates = None
+        for token in sorted(query_tokens, key=len, reverse=True):
+            matches = self.tokens.matches(token)
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                break
+        if candidates:
+            candidates.difference_update(results)
+            return results + heapq.nsmallest(limit - len(results), candidates, key=self.names.__getitem__)
+        if results:
+            return results
+        # Nothing starts with what was typed: fall back to shared name trigrams
+        scores = self.fuzzy_matches(query_tokens)
+        return heapq.nsmallest(limit, scores, key=lambda key: (-scores[key], self.names[key]))
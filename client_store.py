@@ -0,0 +1,148 @@
+import csv
+import os
+import re
+import sqlite3
+import threading
+
+CLIENT_FIELDS = ["Name", "Address", "CP", "Phone", "Email", "CIF"]
+# The CIF index is partial; SQLite only uses it when a query repeats its condition
+CIF_INDEXED = "\"CIF\" != ''"
+
+
+def normalise_cif(cif):
+    # "b-12.345 678" and "B12345678" are the same CIF
+    return re.sub(r"[\s.-]", "", cif or "").upper()
+
+
+class SQLiteClientStore:
+    def __init__(self, db_path="clients_data.sqlite3", fields=None):
+        self.db_path = db_path
+        self.fields = list(CLIENT_FIELDS if fields is None else fields)
+        self.columns = ", ".join(f'"{field}"' for field in self.fields)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.create_tables()
+
+    def create_tables(self):
+        definitions = ", ".join(f"\"{field}\" TEXT NOT NULL DEFAULT ''" for field in self.fields)
+        with self.lock, self.connection:
+            self.connection.execute(f"CREATE TABLE IF NOT EXISTS clients (id INTEGER PRIMARY KEY, {definitions})")
+            self.connection.execute('CREATE INDEX IF NOT EXISTS clients_name ON clients ("Name" COLLATE NOCASE)')
+            # Clients without a CIF are allowed, but a CIF can only belong to one client
+            self.connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS clients_cif ON clients ("CIF") WHERE {CIF_INDEXED}')
+            self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def row_to_client(self, row):
+        return dict(row) if row is not None else None
+
+    def clean(self, client):
+        return [
+            normalise_cif(client.get(field)) if field == "CIF" else (client.get(field) or "").strip()
+            for field in self.fields
+        ]
+
+    def all(self):
+        with self.lock:
+            rows = self.connection.execute(f"SELECT id, {self.columns} FROM clients ORDER BY id").fetchall()
+        return [dict(row) for row in rows]
+
+    def iter_all(self, batch_size=1000):
+        # Streams clients in id order, one batch per query, without holding
+        # the lock (or every row) between batches
+        last_id = 0
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    f"SELECT id, {self.columns} FROM clients WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(row)
+            last_id = rows[-1]["id"]
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM clients").fetchone()[0]
+
+    def get(self, client_id):
+        with self.lock:
+            row = self.connection.execute(f"SELECT id, {self.columns} FROM clients WHERE id = ?", (client_id,)).fetchone()
+        return self.row_to_client(row)
+
+    def get_by_cif(self, cif):
+        cif = normalise_cif(cif)
+        if not cif:
+            return None
+        with self.lock:
+            row = self.connection.execute(f'SELECT id, {self.columns} FROM clients WHERE "CIF" = ? AND {CIF_INDEXED}', (cif,)).fetchone()
+        return self.row_to_client(row)
+
+    def existing_cifs(self, cifs):
+        cifs = list({normalise_cif(cif) for cif in cifs} - {""})
+        if not cifs:
+            return set()
+        placeholders = ", ".join("?" for _ in cifs)
+        with self.lock:
+            rows = self.connection.execute(f'SELECT "CIF" FROM clients WHERE "CIF" IN ({placeholders}) AND {CIF_INDEXED}', cifs).fetchall()
+        return {row[0] for row in rows}
+
+    def _save(self, client):
+        # Caller holds the lock and the transaction
+        values = self.clean(client)
+        cif = values[self.fields.index("CIF")] if "CIF" in self.fields else ""
+        client_id = client.get("id")
+        if not client_id and cif:
+            row = self.connection.execute(f'SELECT id FROM clients WHERE "CIF" = ? AND {CIF_INDEXED}', (cif,)).fetchone()
+            client_id = row[0] if row else None
+        try:
+            if client_id:
+                assignments = ", ".join(f'"{field}" = ?' for field in self.fields)
+                if not self.connection.execute(f"UPDATE clients SET {assignments} WHERE id = ?", values + [client_id]).rowcount:
+                    raise ValueError(f"No client with id {client_id}")
+                return client_id
+            placeholders = ", ".join("?" for _ in self.fields)
+            return self.connection.execute(f"INSERT INTO clients ({self.columns}) VALUES ({placeholders})", values).lastrowid
+        except sqlite3.IntegrityError:
+            raise ValueError(f"CIF {cif} already belongs to another client")
+
+    def save(self, client):
+        # Updates by id, then by CIF; inserts a new client otherwise. Raises
+        # ValueError for an unknown id or a CIF another client already has.
+        with self.lock, self.connection:
+            return self._save(client)
+
+    def save_many(self, clients):
+        with self.lock, self.connection:
+            return [self._save(client) for client in clients]
+
+    def delete(self, client_id):
+        with self.lock, self.connection:
+            return self.connection.execute("DELETE FROM clients WHERE id = ?", (client_id,)).rowcount > 0
+
+    def import_csv(self, path):
+        # One-time migration from the old clients_data.csv
+        key = f"imported:{os.path.abspath(path)}"
+        with self.lock:
+            done = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        if done or not os.path.exists(path):
+            return 0
+        with open(path, mode="r", newline="") as file:
+            rows = list(csv.DictReader(file))
+        with self.lock, self.connection:
+            for row in rows:
+                self._save(row)
+            self.connection.execute("INSERT INTO meta (key, value) VALUES (?, '1')", (key,))
+        return len(rows)
+
+    def export_csv(self, path):
+        with self.lock:
+            cursor = self.connection.execute(f"SELECT {self.columns} FROM clients ORDER BY id")
+            with open(path, mode="w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(self.fields)
+                writer.writerows(cursor)
+
+    def close(self):
+        self.connection.close()
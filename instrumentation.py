@@ -0,0 +1,184 @@
+import atexit
+import cProfile
+import logging
+import os
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+logger = logging.getLogger("porsupuestapp.timing")
+
+_sinks = []
+
+
+class LogSink:
+    def __init__(self, level=logging.INFO):
+        self.level = level
+
+    def record(self, name, seconds, tags):
+        extra = " ".join(f"{key}={value}" for key, value in tags.items())
+        logger.log(self.level, "%s %.2f ms %s", name, seconds * 1000, extra)
+
+
+class MemorySink:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> {"count", "total", "max"}
+        self.spans = {}
+
+    def record(self, name, seconds, tags):
+        with self.lock:
+            stats = self.spans.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: dict(stats, mean=stats["total"] / stats["count"])
+                for name, stats in self.spans.items()
+            }
+
+    def reset(self):
+        with self.lock:
+            self.spans.clear()
+
+
+class PrometheusTextSink(MemorySink):
+    # For the node_exporter textfile collector. "{pid}" in the path gives each
+    # render process its own file.
+    def __init__(self, path, interval=10.0):
+        super().__init__()
+        self.path = path.format(pid=os.getpid())
+        self.interval = interval
+        self.last_flush = 0.0
+        atexit.register(self.flush)
+
+    def record(self, name, seconds, tags):
+        super().record(name, seconds, tags)
+        if time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        lines = [
+            "# HELP porsupuestapp_span_seconds Time spent in each stage.",
+            "# TYPE porsupuestapp_span_seconds summary",
+        ]
+        maxima = [
+            "# HELP porsupuestapp_span_max_seconds Slowest run of each stage.",
+            "# TYPE porsupuestapp_span_max_seconds gauge",
+        ]
+        for name, stats in sorted(self.snapshot().items()):
+            label = f'{{span="{name}"}}'
+            lines.append(f"porsupuestapp_span_seconds_count{label} {stats['count']}")
+            lines.append(f"porsupuestapp_span_seconds_sum{label} {stats['total']:.6f}")
+            maxima.append(f"porsupuestapp_span_max_seconds{label} {stats['max']:.6f}")
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            file.write("\n".join(lines + maxima) + "\n")
+        os.replace(temporary, self.path)
+
+
+def add_sink(sink):
+    _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    _sinks.remove(sink)
+
+
+def clear_sinks():
+    del _sinks[:]
+
+
+@contextmanager
+def span(name, **tags):
+    # Costs next to nothing when no sink is installed
+    if not _sinks:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        for sink in list(_sinks):
+            sink.record(name, elapsed, tags)
+
+
+def timed(name):
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
+
+
+# Opt-in profiling of single renders: PORSUPUESTAPP_PROFILE=cprofile or tracemalloc,
+# output in PORSUPUESTAPP_PROFILE_DIR (default: the current folder)
+PROFILE = os.environ.get("PORSUPUESTAPP_PROFILE", "")
+PROFILE_DIR = os.environ.get("PORSUPUESTAPP_PROFILE_DIR", ".")
+
+
+def profile_path(label, extension):
+    label = re.sub(r"[^\w.-]+", "_", label)
+    return os.path.join(PROFILE_DIR, f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.{extension}")
+
+
+@contextmanager
+def capture(label, mode=None):
+    mode = PROFILE if mode is None else mode
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = profile_path(label, "prof")
+            profiler.dump_stats(path)
+            logger.info("cProfile of %s written to %s", label, path)
+    elif mode == "tracemalloc":
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(25)
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if started_here:
+                tracemalloc.stop()
+            path = profile_path(label, "txt")
+            with open(path, "w") as file:
+                file.write(f"peak traced memory: {peak / 1024:.1f} KiB\n\n")
+                for stat in after.compare_to(before, "lineno")[:30]:
+                    file.write(f"{stat}\n")
+            logger.info("tracemalloc report of %s written to %s", label, path)
+    else:
+        yield
+
+
+def configure_from_env():
+    # PORSUPUESTAPP_TIMING=log, memory or prometheus:/path/to/porsupuestapp-{pid}.prom
+    setting = os.environ.get("PORSUPUESTAPP_TIMING", "")
+    for item in filter(None, (part.strip() for part in setting.split(","))):
+        kind, _, argument = item.partition(":")
+        if kind == "log":
+            add_sink(LogSink())
+        elif kind == "memory":
+            add_sink(MemorySink())
+        elif kind == "prometheus" and argument:
+            add_sink(PrometheusTextSink(argument))
+
+
+configure_from_env()
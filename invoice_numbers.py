@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger("porsupuestapp.numbering")
+
+
+class InvoiceNumberAllocator:
+    def __init__(self, db_path="invoice_counter.sqlite3", legacy_file="invoice_counter.json"):
+        self.db_path = db_path
+        self.legacy_file = legacy_file
+        # Last number handed out by this process, for display only; every
+        # allocation still goes through a database transaction
+        self.year = None
+        self.counter = None
+        self.create_tables()
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent
+        # allocators (other threads, processes or app instances) queue here
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def create_tables(self):
+        with self.transaction() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS counters (year INTEGER PRIMARY KEY, counter INTEGER NOT NULL)")
+            # Numbers given back below the counter: voided, never handed out again
+            db.execute("CREATE TABLE IF NOT EXISTS released (year INTEGER NOT NULL, number INTEGER NOT NULL, PRIMARY KEY (year, number))")
+            empty = db.execute("SELECT COUNT(*) FROM counters").fetchone()[0] == 0
+            if empty and self.legacy_file and os.path.exists(self.legacy_file):
+                legacy = self.read_legacy_file()
+                if legacy is not None:
+                    db.execute("INSERT INTO counters (year, counter) VALUES (?, ?)", legacy)
+
+    def read_legacy_file(self):
+        # The old JSON counter may be empty or half-written (a crash mid-save);
+        # that is no counter to import, not a reason to stop numbering
+        try:
+            with open(self.legacy_file, "r") as f:
+                data = json.load(f)
+            return int(data["year"]), int(data["counter"])
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning("Ignoring unreadable invoice counter %s: %s", self.legacy_file, e)
+            return None
+
+    @staticmethod
+    def format(year, number):
+        return f"{year}-{number:03d}"
+
+    @staticmethod
+    def parse(invoice_number):
+        year, number = invoice_number.split("-")
+        return int(year), int(number)
+
+    def reserve(self, count=1, year=None):
+        # Always the next numbers after the counter: a Spanish invoice series
+        # must be correlative and in date order, so a number is never handed
+        # out after a higher one
+        year = year or datetime.now().year
+        with self.transaction() as db:
+            row = db.execute("SELECT counter FROM counters WHERE year = ?", (year,)).fetchone()
+            counter = row[0] if row else 0
+            numbers = range(counter + 1, counter + count + 1)
+            counter += count
+            db.execute(
+                "INSERT INTO counters (year, counter) VALUES (?, ?) "
+                "ON CONFLICT(year) DO UPDATE SET counter = excluded.counter", (year, counter))
+        self.year, self.counter = year, counter
+        return [self.format(year, n) for n in numbers]
+
+    def allocate(self, year=None):
+        return self.reserve(1, year)[0]
+
+    def release(self, invoice_number):
+        # Only for numbers that never ended up on an issued document. Below
+        # the counter the number is voided (see voided()); only the newest one
+        # goes back, since nothing after it has been issued.
+        year, number = self.parse(invoice_number)
+        with self.transaction() as db:
+            row = db.execute("SELECT counter FROM counters WHERE year = ?", (year,)).fetchone()
+            counter = row[0] if row else 0
+            if number > counter:
+                return
+            if number < counter:
+                db.execute("INSERT OR IGNORE INTO released (year, number) VALUES (?, ?)", (year, number))
+                return
+            # Releasing the newest number rolls the counter back, along with
+            # any voided numbers right below it: nothing after them was issued
+            counter -= 1
+            while db.execute("DELETE FROM released WHERE year = ? AND number = ?", (year, counter)).rowcount:
+                counter -= 1
+            db.execute("UPDATE counters SET counter = ? WHERE year = ?", (counter, year))
+        if self.year == year:
+            self.counter = counter
+
+    def voided(self, year=None):
+        # Numbers skipped in the series, to be accounted for (e.g. in the
+        # invoice register) as cancelled
+        year = year or datetime.now().year
+        connection = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            rows = connection.execute("SELECT number FROM released WHERE year = ? ORDER BY number", (year,)).fetchall()
+        finally:
+            connection.close()
+        return [self.format(year, row[0]) for row in rows]
+
+    def current(self):
+        if self.counter is None:
+            year = datetime.now().year
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            try:
+                row = connection.execute("SELECT counter FROM counters WHERE year = ?", (year,)).fetchone()
+            finally:
+                connection.close()
+            self.year, self.counter = year, row[0] if row else 0
+        return self.format(self.year, self.counter) if self.counter else ""
+
+
+_allocators = {}
+
+
+def get_allocator(db_path="invoice_counter.sqlite3", legacy_file="invoice_counter.json"):
+    key = os.path.abspath(db_path)
+    if key not in _allocators:
+        _allocators[key] = InvoiceNumberAllocator(db_path, legacy_file)
+    return _allocators[key]
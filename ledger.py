@@ -0,0 +1,281 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from datetime import date
+from decimal import Decimal
+
+from client_store import normalise_cif
+from line_items import money, to_decimal
+from output import OUTPUT_DIR, open_output
+
+class LedgerError(Exception):
+    # A document could not be recorded; whatever invoice number it carried
+    # may already belong to an issued document and must not be reused
+    pass
+
+
+def cents(value):
+    # Amounts are stored as integer cents so SUM() is exact and fast
+    return int(money(value) * 100)
+
+
+def from_cents(value):
+    return Decimal(value or 0).scaleb(-2)
+
+
+def rate_text(value):
+    # "21", "21.0" and "21.00" are the same rate and must group together
+    return format(to_decimal(value or 0).normalize(), "f")
+
+
+def quarter_of(day):
+    return (day.month - 1) // 3 + 1
+
+
+class Ledger:
+    # Every issued invoice and budget, with its lines and the data needed to
+    # render it again. Several processes (batch and server workers) may
+    # record at once, hence WAL mode and a generous busy timeout.
+    def __init__(self, db_path="ledger.sqlite3"):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.create_tables()
+
+    def create_tables(self):
+        with self.lock, self.connection:
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS documents (
+                    id INTEGER PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    number TEXT NOT NULL DEFAULT '',
+                    issued TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    quarter INTEGER NOT NULL,
+                    client_key TEXT NOT NULL,
+                    client_name TEXT NOT NULL DEFAULT '',
+                    client_cif TEXT NOT NULL DEFAULT '',
+                    title TEXT NOT NULL DEFAULT '',
+                    iva TEXT NOT NULL,
+                    irpf TEXT NOT NULL,
+                    subtotal_cents INTEGER NOT NULL,
+                    iva_cents INTEGER NOT NULL,
+                    irpf_cents INTEGER NOT NULL,
+                    total_cents INTEGER NOT NULL,
+                    client TEXT NOT NULL,
+                    professional TEXT NOT NULL
+                )""")
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS lines (
+                    document_id INTEGER NOT NULL REFERENCES documents (id) ON DELETE CASCADE,
+                    position INTEGER NOT NULL,
+                    concept TEXT NOT NULL,
+                    units TEXT NOT NULL,
+                    price TEXT NOT NULL,
+                    total_cents INTEGER NOT NULL,
+                    PRIMARY KEY (document_id, position)
+                )""")
+            # An invoice number is issued once; budgets have none
+            self.connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS documents_number ON documents (number) WHERE number != ''")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS documents_client ON documents (kind, client_key)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS documents_period ON documents (kind, year, quarter)")
+
+    def record(self, kind, context, issued=None):
+        # context is BillingCalculator.render_context(); returns the document id
+        issued = issued or date.today()
+        client = dict(context["client_data"] or {})
+        client.pop("id", None)
+        name = (client.get("Name") or "").strip()
+        # Inline clients (server, batch) may spell the CIF any way
+        cif = normalise_cif(client.get("CIF"))
+        number = context.get("invoice_number") or ""
+        # An invoice number already in the ledger raises sqlite3.IntegrityError
+        with self.lock, self.connection:
+            document_id = self.connection.execute(
+                "INSERT INTO documents (kind, number, issued, year, quarter, client_key, client_name, client_cif, title, "
+                "iva, irpf, subtotal_cents, iva_cents, irpf_cents, total_cents, client, professional) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    kind, number, issued.isoformat(), issued.year, quarter_of(issued),
+                    cif or name.lower(), name, cif, context.get("trabajo_title") or "",
+                    rate_text(context["iva"]), rate_text(context["irpf"]),
+                    cents(context["subtotal"]), cents(context["iva_amount"]),
+                    cents(context["irpf_amount"]), cents(context["total"]),
+                    json.dumps(client, ensure_ascii=False),
+                    json.dumps(dict(context["professional_data"] or {}), ensure_ascii=False),
+                ),
+            ).lastrowid
+            self.connection.executemany(
+                "INSERT INTO lines (document_id, position, concept, units, price, total_cents) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (document_id, position, line.concept, str(line.units), str(line.price), cents(line.total))
+                    for position, line in enumerate(context["lines"])
+                ),
+            )
+        return document_id
+
+    def forget(self, document_id):
+        # For a document recorded by record() whose PDF was never delivered
+        # (failed, cancelled); by id, never by number, so an earlier document
+        # with the same number is left alone
+        with self.lock, self.connection:
+            return self.connection.execute("DELETE FROM documents WHERE id = ?", (document_id,)).rowcount > 0
+
+    def get(self, reference):
+        # reference is an invoice number ("2024-007") or a document id
+        if isinstance(reference, int) or str(reference).isdigit():
+            column, reference = "id", int(reference)
+        else:
+            column = "number"
+        with self.lock:
+            row = self.connection.execute(f"SELECT * FROM documents WHERE {column} = ?", (reference,)).fetchone()
+            if row is None:
+                return None
+            lines = self.connection.execute(
+                "SELECT concept, units, price, total_cents FROM lines WHERE document_id = ? ORDER BY position", (row["id"],)
+            ).fetchall()
+        document = dict(row)
+        document["issued"] = date.fromisoformat(document["issued"])
+        document["client"] = json.loads(document["client"])
+        document["professional"] = json.loads(document["professional"])
+        document["subtotal"] = from_cents(document.pop("subtotal_cents"))
+        document["iva_amount"] = from_cents(document.pop("iva_cents"))
+        document["irpf_amount"] = from_cents(document.pop("irpf_cents"))
+        document["total"] = from_cents(document.pop("total_cents"))
+        document["lines"] = [
+            {"concept": line["concept"], "units": line["units"], "price": line["price"], "total": from_cents(line["total_cents"])}
+            for line in lines
+        ]
+        return document
+
+    def documents(self, kind=None, year=None, quarter=None, client=None):
+        # Headers only, newest first
+        where, parameters = self.filters(kind, year, quarter, client)
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT id, kind, number, issued, client_name, client_cif, title, total_cents FROM documents {where} "
+                "ORDER BY issued DESC, id DESC", parameters
+            ).fetchall()
+        return [dict(row, total=from_cents(row["total_cents"])) for row in rows]
+
+    @staticmethod
+    def filters(kind=None, year=None, quarter=None, client=None):
+        conditions, parameters = [], []
+        for column, value in (("kind", kind), ("year", year), ("quarter", quarter), ("client_key", client)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        return ("WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+    def totals(self, group_by, labels=(), kind="invoice", year=None, quarter=None):
+        # Sums per group, all done by SQLite over the indexes; labels are extra
+        # per-group columns such as the client's latest name
+        where, parameters = self.filters(kind, year, quarter)
+        positions = ", ".join(str(position) for position in range(1, len(group_by) + 1))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT {', '.join(list(group_by) + list(labels))}, COUNT(*) AS documents, SUM(subtotal_cents) AS subtotal, SUM(iva_cents) AS iva, "
+                f"SUM(irpf_cents) AS irpf, SUM(total_cents) AS total FROM documents {where} "
+                f"GROUP BY {positions} ORDER BY {positions}", parameters
+            ).fetchall()
+        return [
+            dict(row, subtotal=from_cents(row["subtotal"]), iva=from_cents(row["iva"]),
+                 irpf=from_cents(row["irpf"]), total=from_cents(row["total"]))
+            for row in rows
+        ]
+
+    def revenue_by_client(self, year=None, quarter=None, kind="invoice"):
+        rows = self.totals(["client_key"], ["MAX(client_name) AS client_name", "MAX(client_cif) AS client_cif"], kind, year, quarter)
+        return sorted(rows, key=lambda row: row["subtotal"], reverse=True)
+
+    def revenue_by_quarter(self, year=None, kind="invoice"):
+        return self.totals(["year", "quarter"], kind=kind, year=year)
+
+    def tax_totals(self, year, quarter=None):
+        # What the quarterly IVA and IRPF returns need: taxable base and tax,
+        # split by IVA rate, for the invoices issued in the period
+        return self.totals(["iva AS iva_rate", "irpf AS irpf_rate"], year=year, quarter=quarter)
+
+    def regenerate(self, reference, output=None):
+        # Renders a past document again with its original number, date, client
+        # and professional data. Returns (filename, PDF bytes), or where the
+        # PDF was written when an output folder or Output is given.
+        from billing import BillingCalculator
+
+        document = self.get(reference)
+        if document is None:
+            raise KeyError(f"No document {reference!r} in the ledger")
+        calculator = BillingCalculator()
+        calculator.record_in_ledger = False
+        # A cached budget PDF may carry a later date than the one recorded
+        calculator.use_render_cache = False
+        calculator.trabajo_title = document["title"]
+        calculator.iva = to_decimal(document["iva"])
+        calculator.irpf = to_decimal(document["irpf"])
+        for line in document["lines"]:
+            calculator.lines.add(line["concept"], line["units"], line["price"])
+        invoice = document["kind"] == "invoice"
+        filename = None if invoice else f"budget_{document['id']}.pdf"
+        arguments = (document["professional"], document["client"], invoice, document["number"] or None, filename, document["issued"])
+        if output is None:
+            return calculator.render_invoice(*arguments)
+        return calculator.generate_invoice(output, *arguments)
+
+    def close(self):
+        self.connection.close()
+
+
+_ledgers = {}
+
+
+def get_ledger(db_path="ledger.sqlite3"):
+    key = os.path.abspath(db_path)
+    if key not in _ledgers:
+        _ledgers[key] = Ledger(db_path)
+    return _ledgers[key]
+
+
+def print_totals(rows, label):
+    print(f"{'':<30}{'docs':>6}{'base':>14}{'IVA':>12}{'IRPF':>12}{'total':>14}")
+    for row in rows:
+        print(f"{label(row):<30}{row['documents']:>6}{row['subtotal']:>14}{row['iva']:>12}{row['irpf']:>12}{row['total']:>14}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reports on issued invoices and budgets, and re-rendering of past PDFs.")
+    parser.add_argument("--db", default="ledger.sqlite3", help="ledger database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    clients = commands.add_parser("clients", help="revenue per client")
+    quarters = commands.add_parser("quarters", help="revenue per quarter")
+    taxes = commands.add_parser("taxes", help="IVA and IRPF totals by rate, for tax returns")
+    for command in (clients, quarters, taxes):
+        command.add_argument("-y", "--year", type=int)
+    for command in (clients, taxes):
+        command.add_argument("-q", "--quarter", type=int, choices=[1, 2, 3, 4])
+    regenerate = commands.add_parser("regenerate", help="render a past invoice (by number) or budget (by id) again")
+    regenerate.add_argument("reference", nargs="+")
+    regenerate.add_argument("-o", "--output", default=OUTPUT_DIR, help="folder, .zip, .tar or .tar.gz archive")
+    args = parser.parse_args(argv)
+
+    ledger = Ledger(args.db)
+    if args.command == "clients":
+        print_totals(ledger.revenue_by_client(args.year, args.quarter), lambda row: row["client_name"] or row["client_key"])
+    elif args.command == "quarters":
+        print_totals(ledger.revenue_by_quarter(args.year), lambda row: f"{row['year']} Q{row['quarter']}")
+    elif args.command == "taxes":
+        year = args.year or date.today().year
+        print_totals(ledger.tax_totals(year, args.quarter), lambda row: f"IVA {row['iva_rate']}% IRPF {row['irpf_rate']}%")
+    else:
+        with open_output(args.output) as output:
+            for reference in args.reference:
+                print(ledger.regenerate(reference, output))
+    ledger.close()
+
+
+if __name__ == "__main__":
+    main()
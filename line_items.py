@@ -0,0 +1,151 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CENT = Decimal("0.01")
+ZERO = Decimal("0.00")
+# Column names that mark the first pasted line as a header
+CONCEPT_HEADERS = {"concept", "name", "units", "price"}
+
+
+def to_decimal(value):
+    # Accepts what users type ("12,5"), JSON numbers and Decimals; NaN and
+    # infinities are not amounts
+    if isinstance(value, Decimal):
+        number = value
+    else:
+        text = repr(value) if isinstance(value, float) else str(value if value is not None else "")
+        try:
+            number = Decimal(text.strip().replace(",", ".") or "0")
+        except InvalidOperation:
+            raise ValueError(f"Not a number: {value!r}")
+    if not number.is_finite():
+        raise ValueError(f"Not a number: {value!r}")
+    return number
+
+
+def money(value):
+    try:
+        return to_decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        # More digits than Decimal's precision once in cents
+        raise ValueError(f"Amount too large: {value!r}")
+
+
+def quantity(value):
+    # Units keep what was typed ("3", "1.5") but never more than two decimals
+    value = to_decimal(value)
+    if value.as_tuple().exponent < -2:
+        value = money(value)
+    return value
+
+
+def tax_amount(base, rate):
+    return money(base * to_decimal(rate) / 100) if rate else ZERO
+
+
+class LineItem:
+    __slots__ = ("concept", "units", "price", "total")
+
+    def __init__(self, concept, units=0, price=0):
+        self.concept = concept
+        self.units = quantity(units)
+        self.price = money(price)
+        self.total = money(self.units * self.price)
+
+    def __repr__(self):
+        return f"LineItem({self.concept!r}, {self.units}, {self.price})"
+
+
+class LineItems:
+    def __init__(self):
+        self.items = []
+        # concept -> position in self.items
+        self.index = {}
+        # Kept up to date by add/set/remove, so reading it never walks the lines
+        self.running_subtotal = ZERO
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __contains__(self, concept):
+        return concept in self.index
+
+    def get(self, concept):
+        position = self.index.get(concept)
+        return self.items[position] if position is not None else None
+
+    def add(self, concept, units=0, price=0):
+        if concept in self.index:
+            raise ValueError(f"Duplicate concept: {concept}")
+        item = LineItem(concept, units, price)
+        self.index[concept] = len(self.items)
+        self.items.append(item)
+        self.running_subtotal += item.total
+        return item
+
+    def set(self, concept, units, price):
+        item = self.get(concept)
+        if item is None:
+            return self.add(concept, units, price)
+        previous = item.total
+        # Nothing changes unless the new values are valid
+        units, price = quantity(units), money(price)
+        item.units, item.price, item.total = units, price, money(units * price)
+        # Only the difference for this line; exact because totals are whole cents
+        self.running_subtotal += item.total - previous
+        return item
+
+    def remove(self, concept):
+        position = self.index.pop(concept)
+        self.running_subtotal -= self.items[position].total
+        del self.items[position]
+        for item in self.items[position:]:
+            self.index[item.concept] -= 1
+
+    def add_many(self, rows):
+        # Bulk import: new concepts are appended, known ones get the new values
+        for concept, units, price in rows:
+            self.set(concept, units, price)
+
+    def subtotal(self):
+        return self.running_subtotal
+
+    def recalculate(self):
+        # Full pass over the lines; line totals are whole cents, so the sum is exact
+        self.running_subtotal = sum((item.total for item in self.items), ZERO)
+        return self.running_subtotal
+
+
+def parse_concepts(text):
+    # One concept per line: "concept<TAB>units<TAB>price", also with ";" or ","
+    # between columns (as pasted from a spreadsheet or exported as CSV).
+    # Returns the parsed rows and a list of (line number, error) pairs.
+    rows = []
+    errors = []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        if not line.strip():
+            continue
+        if "\t" in line:
+            columns = line.split("\t")
+        elif ";" in line:
+            columns = line.split(";")
+        else:
+            columns = line.split(",")
+        columns = [column.strip() for column in columns]
+        concept = columns[0]
+        units = columns[1] if len(columns) > 1 else "0"
+        price = columns[2] if len(columns) > 2 else "0"
+        try:
+            rows.append((concept, quantity(units), money(price)))
+        except ValueError as e:
+            # A header row is not an error; anything else on line 1 is
+            if line_number == 1 and {column.lower() for column in columns} & CONCEPT_HEADERS:
+                continue
+            errors.append((line_number, str(e)))
+            continue
+        if not concept:
+            rows.pop()
+            errors.append((line_number, "Missing concept"))
+    return rows, errors
@@ -0,0 +1,129 @@
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+
+OUTPUT_DIR = os.environ.get("PORSUPUESTAPP_OUTPUT_DIR", os.path.expanduser("~/Desktop"))
+# Read once at import: setting and restoring the umask later would race
+# with threads creating files
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+class Output:
+    # Where rendered PDFs go. write() gets the file name and the PDF bytes and
+    # returns a description of where it ended up.
+    def write(self, filename, data):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DirectoryOutput(Output):
+    def __init__(self, folder=OUTPUT_DIR):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    def write(self, filename, data):
+        filepath = os.path.join(self.folder, filename)
+        descriptor, temporary = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                file.write(data)
+            # mkstemp creates the file 0600; give it the mode open() would have
+            os.chmod(temporary, 0o666 & ~UMASK)
+            os.replace(temporary, filepath)
+        except BaseException:
+            # A full disk or a failed replace must not leave .tmp files behind
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+            raise
+        return filepath
+
+
+class MemoryOutput(Output):
+    # Nothing touches the disk; callers read the bytes back from self.files
+    def __init__(self):
+        self.files = {}
+
+    def write(self, filename, data):
+        self.files[filename] = data
+        return filename
+
+    def getvalue(self, filename):
+        return self.files[filename]
+
+
+class ZipOutput(Output):
+    # Each PDF is streamed into the archive as it arrives; only one is held at a time
+    def __init__(self, target, compression=zipfile.ZIP_STORED):
+        # PDFs are already compressed, so entries are stored as they are by default
+        self.target = target
+        self.archive = zipfile.ZipFile(target, mode="w", compression=compression)
+
+    def write(self, filename, data):
+        with self.archive.open(filename, mode="w") as entry:
+            entry.write(data)
+        return f"{self.name}:{filename}"
+
+    @property
+    def name(self):
+        return self.target if isinstance(self.target, str) else getattr(self.target, "name", "<zip>")
+
+    def close(self):
+        self.archive.close()
+
+
+class TarOutput(Output):
+    # Stream mode, so the target can be a pipe or stdout as well as a file
+    def __init__(self, target, compression=""):
+        self.target = target
+        if isinstance(target, str):
+            self.archive = tarfile.open(target, mode=f"w|{compression}")
+        else:
+            self.archive = tarfile.open(fileobj=target, mode=f"w|{compression}")
+
+    def write(self, filename, data):
+        info = tarfile.TarInfo(filename)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self.archive.addfile(info, io.BytesIO(data))
+        return f"{self.name}:{filename}"
+
+    @property
+    def name(self):
+        return self.target if isinstance(self.target, str) else getattr(self.target, "name", "<tar>")
+
+    def close(self):
+        self.archive.close()
+
+
+def open_output(spec):
+    # "out.zip", "out.tar", "out.tar.gz", "-" (tar to stdout) or a folder
+    if isinstance(spec, Output):
+        return spec
+    lower = spec.lower()
+    if spec == "-":
+        return TarOutput(sys.stdout.buffer)
+    if lower.endswith(".zip"):
+        return ZipOutput(spec)
+    if lower.endswith((".tar.gz", ".tgz")):
+        return TarOutput(spec, "gz")
+    if lower.endswith(".tar.xz"):
+        return TarOutput(spec, "xz")
+    if lower.endswith(".tar"):
+        return TarOutput(spec)
+    return DirectoryOutput(spec)
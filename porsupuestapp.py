@@ -1,319 +1,15 @@
 import flet as ft
-import csv
-from datetime import datetime
-from weasyprint import HTML
-from jinja2 import Environment, BaseLoader
-import os
-import json
-
-class BillingCalculator:
-    def __init__(self):
-        self.trabajo_title = ""
-        self.concepts = []
-        self.totals = {}
-        self.units = {}
-        self.prices = {}
-        self.subtotal = 0
-        self.total = 0
-        self.irpf = 0
-        self.iva = 0
-        self.invoice_counter_file = "invoice_counter.json"
-
-    def calculate_subtotal(self):
-        self.subtotal = round(sum(self.totals.values()),3)
-
-    def calculate_total(self):
-        iva_amount = round(self.subtotal * (self.iva / 100), 3) if self.iva else 0
-        irpf_amount = round(self.subtotal * (self.irpf / 100), 3) if self.irpf else 0
-        self.total = round(self.subtotal + iva_amount - irpf_amount, 3)
-
-
-    def load_invoice_counter(self):
-        if os.path.exists(self.invoice_counter_file):
-            with open(self.invoice_counter_file, "r") as f:
-                data = json.load(f)
-        else:
-            data = {"year": datetime.now().year, "counter": 0}
-        return data
-
-    def save_invoice_counter(self, data):
-        with open(self.invoice_counter_file, "w") as f:
-            json.dump(data, f)
-
-    def generate_invoice_number(self):
-        today = datetime.now()
-        current_year = today.year
-        data = self.load_invoice_counter()
-
-        if data["year"] != current_year:
-            data["year"] = current_year
-            data["counter"] = 1
-        else:
-            data["counter"] += 1
-        self.save_invoice_counter(data)
-        return f"{current_year}-{data['counter']:03d}"
-
-    def get_current_date(self):
-        return datetime.now().strftime("%d/%m/%Y")
-
-
-    def generate_invoice(self, output_folder, professional_data, client_data, include_invoice_number=True):
-        self.calculate_subtotal()
-        self.calculate_total()
-
-        if include_invoice_number:
-            invoice_number = self.generate_invoice_number()
-        else:
-            invoice_number = ""
-        current_date = self.get_current_date()
-
-        template = """
-        <!DOCTYPE html>
-        <html lang="es">
-        <head>
-            <meta charset="UTF-8" />
-            <meta name="viewport" content="width=device-width, initial-scale=1.0" />
-            <h2>{{ trabajo_title }}</h2>
-            {% if invoice_number %}
-                <h4>{{ invoice_number }}</h4>
-            {% endif %}
-            </h4>{{ current_date }}</h4>
-            <title>Factura</title>
-            <style>
-            * {
-                margin: 0;
-                padding: 0;
-                box-sizing: border-box;
-                font-family: Arial, Helvetica, sans-serif;
-                font-size: 16px;
-            }
-            main {
-                padding: 50px;
-            }
-
-            #primera {
-                display: flex;
-                justify-content: space-between;  
-            }
-
-            #datos_profesional {
-                text-align: left;
-                width: 40%;
-                font-size: 20px;
-            }
-            #datos_cliente {
-                text-align: right;
-                width: 40%;
-                font-size: 20px;
-            }
-
-            .nom_empresa {
-                font-size: 24px;
-                color: #1183b8;
-                border-bottom: 2px solid #1183b8;
-            }
-            table{
-                margin-top: 50px;
-                border: 2px;
-                width: 100%;
-                border-collapse: collapse;
-            }
-            .tres_columnas {
-                text-align: right;
-            }
-
-            .table_left{
-                text-align: left;
-            }
-            .table_center{
-                text-align: center;
-            }
-            .table_right{
-                text-align: right;
-            }
-            td, th {
-                border: 1px solid black;
-                padding: 5px;
-            }
-
-            thead{
-                background-color: #1183b8;
-                color: white;
-            }
-
-            .total{
-                font-size: 20px;
-                font-weight: bold;
-            }
-            #pago{
-                margin-top: 50px;
-                margin-bottom: 50px;
-            }
-            #firma{
-                margin-top: 50px;
-                height: 200px;
-            }
-            h2 {
-                margin-top: 20px;
-                margin-bottom: 10px;
-                font-size: 22px;
-                color: #1183b8;
-            }
-            </style>
-        </head>
-        <body>
-            <main>
-            <section id="primera">
-                <div id="datos_profesional">
-                <p class="nom_empresa">{{ professional_data.Name }}</p>
-                <p>{{ professional_data.Address }}</p>
-                <p>{{ professional_data.CP }}</p>
-                <p>{{ professional_data.Phone }}</p>
-                <p>{{ professional_data.Email }}</p>
-                <p>{{ professional_data.Portfolio }}</p>
-                <p>CIF: {{ professional_data.CIF }}</p>
-                </div>
-                <div id="datos_cliente">
-                <p class="nom_empresa">{{ client_data.Name }}</p>
-                <p>{{ client_data.Address }}</p>
-                <p>{{ client_data.CP }}</p>
-                <p>{{ client_data.Phone }}</p>
-                <p>{{ client_data.Email }}</p>
-                <p>CIF: {{ client_data.CIF }}</p>
-                </div>
-            </section>
-
-            <section id="segona">
-                <table>
-                <thead>
-                    <tr>
-                    <th class="table_left">Descripción</th>
-                    <th class="table_center">Unidades</th>
-                    <th class="table_right">Precio unitario</th>
-                    <th class="table_right">Total</th>
-                    </tr>
-                </thead>
-                <tbody>
-                    {% for concept in concepts %}
-                    <tr>
-                    <td class="table_left">{{ concept }}</td>
-                    <td class="table_center">{{ units[concept] }}</td>
-                    <td class="table_right">{{ prices[concept] }}€</td>
-                    <td class="table_right">{{ totals[concept] | round(3) }}€</td>
-                    </tr>
-                    {% endfor %}
-                    <tr>
-                    <td class="tres_columnas" colspan="3">Subtotal</td>
-                    <td class="table_right">{{ subtotal | round(3) }}€</td>
-                    </tr>
-                    <tr>
-                    {% if iva and iva != 0 %}
-                    <tr>
-                        <td class="tres_columnas" colspan="3">IVA ({{ iva }}%)</td>
-                        <td class="table_right">{{ subtotal * iva / 100 | round(3) }}€</td>
-                    </tr>
-                    {% endif %}
-                    {% if irpf and irpf != 0 %}
-                    <tr>
-                        <td class="tres_columnas" colspan="3">IRPF (-{{ irpf }}%)</td>
-                        <td class="table_right">-{{ subtotal * irpf / 100 | round(3) }}€</td>
-                    </tr>
-                    {% endif %}
-                    </tr>
-                    <tr>
-                    <td class="tres_columnas total" colspan="3">Total</td>
-                    <td class="table_right total">{{ total | round(3) }}€</td>
-                    </tr>
-                </tbody>
-                </table>
-            </section>
-            <section id="pago">
-                <p>Datos de pago:</p>
-                <p>IBAN: {{ professional_data.IBAN }}</p>
-                <p>SWIFT/BIC: {{ professional_data.SWIFT }}</p>
-            </section>
-            <section id="firma">
-                <p>Firma:</p>
-            </section>
-            </main>
-        </body>
-        </html>
-        """
-
-        env = Environment(loader=BaseLoader())
-        template = env.from_string(template)
-        html_out = template.render(
-            professional_data=professional_data,
-            client_data=client_data,
-            trabajo_title=self.trabajo_title,
-            concepts=self.concepts,
-            units=self.units,
-            prices=self.prices,
-            totals=self.totals,
-            subtotal=self.subtotal,
-            irpf=self.irpf,
-            iva=self.iva,
-            total=self.total,
-            invoice_number=invoice_number,
-            current_date=current_date
-        )
-
-        filename = f"invoice_{invoice_number if include_invoice_number else 'sin_numero'}.pdf"
-        filepath = os.path.join(output_folder, filename)
-
-        HTML(string=html_out).write_pdf(filepath)
-        return filepath
-
-class ProfessionalDataManager:
-    def __init__(self):
-        self.fields = ["Name", "Address", "CP", "CIF", "Phone", "Email", "Portfolio", "IBAN", "SWIFT"]
-        self.data = {field: "" for field in self.fields}
-        self.file_path = "professional_data.csv"
-        self.load_data()
-
-    def load_data(self):
-        if os.path.exists(self.file_path):
-            with open(self.file_path, mode="r") as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    self.data.update(row)
-
-    def save_data(self):
-        with open(self.file_path, mode="w", newline="") as file:
-            writer = csv.DictWriter(file, fieldnames=self.fields)
-            writer.writeheader()
-            writer.writerow(self.data)
-
-class ClientDataManager:
-    def __init__(self):
-        self.fields = ["Name", "Address", "CP", "Phone", "Email", "CIF"]
-        self.clients = []
-        self.current_client = {}
-        self.file_path = "clients_data.csv"
-        self.load_clients()
-
-    def load_clients(self):
-        if os.path.exists(self.file_path):
-            with open(self.file_path, mode="r") as file:
-                reader = csv.DictReader(file)
-                self.clients = [row for row in reader]
-
-    def add_client(self, client_data):
-        self.clients.append(client_data)
-        self.current_client = client_data
-        self.save_clients()
-
-    def save_clients(self):
-        with open(self.file_path, mode="w", newline="") as file:
-            writer = csv.DictWriter(file, fieldnames=self.fields)
-            writer.writeheader()
-            writer.writerows(self.clients)
-
-    def select_client(self, index):
-        if 0 <= index < len(self.clients):
-            self.current_client = self.clients[index]
-            return self.current_client
-        return None
+from billing import BillingCalculator, ProfessionalDataManager, ClientDataManager
+from batch import job_from_calculator, release_number
+from render_queue import RenderQueue
+from output import OUTPUT_DIR
+from client_search import ClientSearchIndex
+from line_items import to_decimal, parse_concepts
+from bulk_io import read_concepts, export_concepts
+from catalogue import Catalogue
+import threading
+
+CONCEPT_PAGE_SIZE = 50
 
 def main(page: ft.Page):
     page.title = "Porsupuestapp"
@@ -335,70 +31,264 @@ def main(page: ft.Page):
 
     calculator = BillingCalculator()
     professional_manager = ProfessionalDataManager()
-    client_manager = ClientDataManager()
-
-    def update_totals():
+    # Clients and the catalogue are read in the background once the window is up
+    client_manager = ClientDataManager(load=False)
+    catalogue = Catalogue(load=False)
+
+    # Keystrokes only mark controls dirty; one timer pushes them all in a
+    # single targeted update instead of re-sending the whole page each time
+    pending_refresh = {}
+    refresh_lock = threading.Lock()
+    refresh_timer = [None]
+
+    def refresh(*controls):
+        with refresh_lock:
+            for control in controls:
+                pending_refresh[id(control)] = control
+            if refresh_timer[0] is None:
+                refresh_timer[0] = threading.Timer(0.03, flush_refresh)
+                refresh_timer[0].start()
+
+    def flush_refresh():
+        with refresh_lock:
+            controls = list(pending_refresh.values())
+            pending_refresh.clear()
+            refresh_timer[0] = None
+        page.update(*controls)
+
+    def update_totals(*changed):
+        # The line set already moved the running subtotal by its difference
         calculator.calculate_subtotal()
         calculator.calculate_total()
         subtotal_text.value = f"Subtotal: {calculator.subtotal:.2f}€"
         total_text.value = f"Total: {calculator.total:.2f}€"
-        page.update()
+        refresh(subtotal_text, total_text, *changed)
 
     def add_concept_row(concept):
         def update_total(e):
             if units.value and price.value:
-                calculator.units[concept] = round(float(units.value),2)
-                calculator.prices[concept] = round(float(price.value),2)
-                calculator.totals[concept] = round(calculator.units[concept] * calculator.prices[concept],2)
-                total.value = f"{calculator.totals[concept]:.2f}€"
-                update_totals()
-
-        units = ft.TextField(label="Units", width=100, on_change=update_total, suffix_text="h")
-        price = ft.TextField(label="Price", width=100, on_change=update_total, suffix_text="€")
-        total = ft.Text(f"{calculator.totals.get(concept, 0):.2f}€", width=100)
+                try:
+                    line = calculator.lines.set(concept, units.value, price.value)
+                except ValueError:
+                    return
+                total.value = f"{line.total}€"
+                update_totals(total)
+
+        line = calculator.lines.get(concept)
+        units = ft.TextField(label="Units", value=str(line.units) if line.units else "", width=100, on_change=update_total, suffix_text="h")
+        price = ft.TextField(label="Price", value=str(line.price) if line.price else "", width=100, on_change=update_total, suffix_text="€")
+        total = ft.Text(f"{line.total}€", width=100)
 
         return ft.Row([
             ft.Text(concept, width=150, size=16, weight=ft.FontWeight.BOLD),
             units,
             price,
-            total
+            total,
+            ft.IconButton(ft.icons.BOOKMARK_ADD_OUTLINED, tooltip="Save to catalogue", on_click=lambda _: save_to_catalogue(concept)),
         ], alignment=ft.MainAxisAlignment.CENTER)
 
+    def build_concept_rows(count=CONCEPT_PAGE_SIZE):
+        # Rows are only built for the lines scrolled into reach
+        start = len(concept_rows.controls)
+        for line in calculator.lines.items[start:start + count]:
+            concept_rows.controls.append(add_concept_row(line.concept))
+
+    def load_more_concepts(e):
+        if e.pixels >= e.max_scroll_extent - 300 and len(concept_rows.controls) < len(calculator.lines):
+            build_concept_rows()
+            concept_rows.update()
+
     def add_new_concept(e):
         new_concept = new_concept_name.value
-        if new_concept and new_concept not in calculator.concepts:
-            calculator.concepts.append(new_concept)
-            calculator.totals[new_concept] = 0
-            calculator.units[new_concept] = 0
-            calculator.prices[new_concept] = 0
-            concept_rows.controls.append(add_concept_row(new_concept))
-            new_concept_name.value = ""
-            page.update()
+        if new_concept and new_concept not in calculator.lines:
+            calculator.lines.add(new_concept)
+            show_new_concept(new_concept)
+
+    def show_new_concept(concept):
+        # Otherwise it is built when the list is scrolled down to it
+        if len(concept_rows.controls) == len(calculator.lines) - 1:
+            concept_rows.controls.append(add_concept_row(concept))
+        new_concept_name.value = ""
+        catalogue_results.controls = []
+        page.update()
+
+    def suggest_services(e):
+        # Served from the catalogue's in-memory index, memoised per query
+        catalogue_results.controls = [
+            ft.ListTile(
+                title=ft.Text(service["name"]),
+                subtitle=ft.Text(service_summary(service)),
+                dense=True,
+                on_click=lambda _, service=service: add_service(service),
+            )
+            for service in (catalogue.search(new_concept_name.value, limit=6) if new_concept_name.value else [])
+            if service["name"] not in calculator.lines
+        ]
+        catalogue_results.update()
+
+    def service_summary(service):
+        summary = f"{service['units']} {service['unit'] or 'x'} · {service['price']}€"
+        rates = [f"{tax.upper()} {service[tax]}%" for tax in ("iva", "irpf") if service[tax]]
+        return " · ".join([summary] + rates)
+
+    def add_service(service):
+        calculator.add_service(service)
+        catalogue.used(service["id"])
+        iva_field.value = str(calculator.iva)
+        irpf_field.value = str(calculator.irpf)
+        update_totals(iva_field, irpf_field)
+        show_new_concept(service["name"])
+
+    def save_to_catalogue(concept):
+        line = calculator.lines.get(concept)
+        catalogue.save({"name": concept, "units": line.units or 1, "price": line.price, "iva": calculator.iva or "", "irpf": calculator.irpf or ""})
+        page.overlay.append(ft.SnackBar(content=ft.Text(f"{concept} saved to the catalogue")))
+        page.update()
+
+    def import_concepts(rows, errors):
+        calculator.lines.add_many(rows)
+        concept_rows.controls.clear()
+        build_concept_rows()
+        update_totals(concept_rows)
+        message = f"{len(rows)} concepts imported"
+        if errors:
+            message += f", {len(errors)} lines skipped (first: line {errors[0][0]}, {errors[0][1]})"
+        page.overlay.append(ft.SnackBar(content=ft.Text(message)))
+        page.update()
+
+    def import_pasted_concepts(e):
+        if bulk_concepts.value:
+            import_concepts(*parse_concepts(bulk_concepts.value))
+            bulk_concepts.value = ""
+            bulk_concepts.update()
+
+    def import_concept_file(e):
+        if e.files:
+            import_concepts(*read_concepts(e.files[0].path))
+
+    def export_concept_file(e):
+        if e.path:
+            export_concepts(calculator.lines, e.path)
 
     def select_client(e):
         if client_dropdown.value:
-            selected_index = int(client_dropdown.value.split(':')[0])
-            selected_client = client_manager.select_client(selected_index)
+            selected_client = client_manager.select_client(int(client_dropdown.value))
             if selected_client:
                 update_client_fields(selected_client)
                 page.update()
 
+    def search_clients(e):
+        client_results.controls = [
+            ft.ListTile(
+                title=ft.Text(client_manager.clients_by_id[client_id]['Name']),
+                subtitle=ft.Text(f"{client_manager.clients_by_id[client_id]['CIF']}  {client_manager.clients_by_id[client_id]['Email']}"),
+                dense=True,
+                on_click=lambda _, client_id=client_id: pick_search_result(client_id),
+            )
+            for client_id in client_index.search(client_search.value, limit=8)
+        ]
+        client_results.update()
+
+    def pick_search_result(client_id):
+        selected_client = client_manager.select_client(client_id)
+        if selected_client:
+            client_search.value = ""
+            client_results.controls = []
+            client_dropdown.value = str(client_id)
+            update_client_fields(selected_client)
+
+    def save_client():
+        try:
+            client = client_manager.add_client({field: control.value for field, control in client_fields.items()})
+        except ValueError as e:
+            page.overlay.append(ft.SnackBar(content=ft.Text(f"Could not save client: {e}")))
+            page.update()
+            return
+        client_index.add(client["id"], client)
+        # Move or insert just this option at its alphabetical position
+        option = client_options.pop(client["id"], None)
+        if option is not None:
+            client_dropdown.options.remove(option)
+        client_options[client["id"]] = ft.dropdown.Option(str(client["id"]), client["Name"])
+        client_dropdown.options.insert(client_manager.sorted_position(client["id"]), client_options[client["id"]])
+        client_dropdown.value = str(client["id"])
+        page.update()
+
+    def load_saved_data():
+        catalogue.load()
+        client_manager.load_clients()
+        show_clients()
+
+    def show_clients():
+        client_options.clear()
+        client_options.update((client["id"], ft.dropdown.Option(str(client["id"]), client["Name"])) for client in client_manager.sorted_clients)
+        client_dropdown.options = list(client_options.values())
+        client_index.build(client_manager.clients_by_id.items())
+        client_search.disabled = False
+        page.update()
+        client_index.build_trigrams()
+
+    def import_client_file(e):
+        if e.files:
+            threading.Thread(target=import_clients, args=(e.files[0].path,), daemon=True).start()
+
+    def import_clients(path):
+        report = client_manager.import_file(path)
+        show_clients()
+        message = str(report)
+        if report.errors:
+            message += f" (first: line {report.errors[0][0]}, {report.errors[0][1]})"
+        page.overlay.append(ft.SnackBar(content=ft.Text(message)))
+        page.update()
+
+    def export_client_file(e):
+        if e.path:
+            client_manager.export_file(e.path)
+
     def update_client_fields(client_data):
         for field in client_manager.fields:
             client_fields[field].value = client_data.get(field, '')
         page.update()
 
     def generate_invoice(include_invoice_number=True):
-        output_folder = os.path.expanduser("~/Desktop")
-        filepath = calculator.generate_invoice(
-            output_folder,
+        # Snapshot the budget and hand it to the render queue so the window stays responsive
+        job = job_from_calculator(
+            calculator,
             professional_manager.data,
             client_manager.current_client,
             include_invoice_number=include_invoice_number
         )
-        page.overlay.append(ft.SnackBar(content=ft.Text(f"Invoice saved: {filepath}")))
+        if include_invoice_number:
+            job["invoice_number"] = calculator.generate_invoice_number()
+        render_queue.submit(job)
+
+    def choose_output_folder(e):
+        if e.path:
+            render_queue.output_folder = e.path
+            output_folder_button.tooltip = e.path
+            output_folder_button.update()
+
+    def render_finished(job, result):
+        # A number that never made it onto a PDF goes back to the allocator
+        release_number(calculator, job, result)
+        if result.get("cancelled"):
+            message = "PDF generation cancelled"
+        elif result["error"]:
+            message = f"Could not generate PDF: {result['error']}"
+        else:
+            message = f"Invoice saved: {result['filepath']}"
+        page.overlay.append(ft.SnackBar(content=ft.Text(message)))
+        page.update()
+
+    def render_status_changed(queue):
+        render_progress.visible = queue.busy
+        cancel_render_button.visible = queue.busy
+        render_status.value = f"Generating PDF... ({queue.queued} in queue)" if queue.busy else ""
         page.update()
 
+    # Created once its callbacks exist; the handlers above only use it when called
+    render_queue = RenderQueue(OUTPUT_DIR, on_change=render_status_changed, on_done=render_finished)
+
     def save_professional_data():
         for field, control in zip(professional_manager.fields, professional_fields):
             professional_manager.data[field] = control.value
@@ -408,8 +298,8 @@ def main(page: ft.Page):
 
     def update_tax_values(e):
         try:
-            calculator.irpf = float(irpf_field.value) if irpf_field.value else 0
-            calculator.iva = float(iva_field.value) if iva_field.value else 0
+            calculator.irpf = to_decimal(irpf_field.value) if irpf_field.value else 0
+            calculator.iva = to_decimal(iva_field.value) if iva_field.value else 0
             update_totals()
         except ValueError:
             page.overlay.append(ft.SnackBar(content=ft.Text("Please enter valid numbers for taxes")))
@@ -417,13 +307,26 @@ def main(page: ft.Page):
 
     # Billing Tab Content
     trabajo_title = ft.TextField(label="Project", value=calculator.trabajo_title, on_change=lambda e: setattr(calculator, 'trabajo_title', e.control.value))
-    concept_rows = ft.Column(spacing=10)
-    new_concept_name = ft.TextField(label="New Concept", expand=True)
+    # Virtualised: Flutter only lays out visible rows, and the Python rows
+    # themselves are built a page at a time as the list is scrolled
+    concept_rows = ft.ListView(spacing=10, height=360, item_extent=60, on_scroll=load_more_concepts, on_scroll_interval=100)
+    build_concept_rows()
+    new_concept_name = ft.TextField(label="New Concept", expand=True, on_change=suggest_services, on_submit=add_new_concept)
     add_concept_button = ft.FloatingActionButton("Add Concept", on_click=add_new_concept, icon=ft.icons.ADD, bgcolor=ft.cupertino_colors.ACTIVE_BLUE, foreground_color=ft.colors.WHITE)
-
-    concept_rows.controls.extend([
-        ft.Row([new_concept_name, add_concept_button], alignment=ft.MainAxisAlignment.CENTER),
-    ])
+    new_concept_row = ft.Row([new_concept_name, add_concept_button], alignment=ft.MainAxisAlignment.CENTER)
+    # Catalogue matches for what is being typed; one click adds the line
+    catalogue_results = ft.Column(spacing=0)
+
+    bulk_concepts = ft.TextField(label="Paste concepts (concept; units; price per line)", multiline=True, min_lines=1, max_lines=4, expand=True)
+    concept_file_picker = ft.FilePicker(on_result=import_concept_file)
+    concept_export_picker = ft.FilePicker(on_result=export_concept_file)
+    page.overlay.extend([concept_file_picker, concept_export_picker])
+    bulk_concepts_row = ft.Row([
+        bulk_concepts,
+        ft.IconButton(ft.icons.PLAYLIST_ADD, tooltip="Add pasted concepts", on_click=import_pasted_concepts),
+        ft.IconButton(ft.icons.UPLOAD_FILE, tooltip="Import concepts from CSV or JSONL", on_click=lambda _: concept_file_picker.pick_files(allowed_extensions=["csv", "tsv", "txt", "jsonl"])),
+        ft.IconButton(ft.icons.DOWNLOAD, tooltip="Export concepts", on_click=lambda _: concept_export_picker.save_file(file_name="concepts.csv", allowed_extensions=["csv", "jsonl"])),
+    ], alignment=ft.MainAxisAlignment.CENTER)
 
     subtotal_text = ft.Text(f"Subtotal: {calculator.subtotal:.2f}€", size=16, weight=ft.FontWeight.BOLD)
     total_text = ft.Text(f"Total: {calculator.total:.2f}€", size=24, weight=ft.FontWeight.BOLD)
@@ -431,14 +334,13 @@ def main(page: ft.Page):
     irpf_field = ft.TextField(label="IRPF (%)", value=str(calculator.irpf), width=100, on_change=update_tax_values)
     iva_field = ft.TextField(label="IVA (%)", value=str(calculator.iva), width=100, on_change=update_tax_values)
 
-#Ordenar alfabéticamente los clientes
-    sorted_clients = sorted(client_manager.clients, key=lambda client: client['Name'].lower())
+    # Options keyed by client id, in the manager's alphabetical order; filled by show_clients()
+    client_options = {}
 
     # Client Data Tab Content
     client_dropdown = ft.Dropdown(
         label="Select Client",
-        options=[ft.dropdown.Option(str(i), client['Name']) for i, client in enumerate(sorted_clients)],
-        #options=[ft.dropdown.Option(str(i), client['Name']) for i, client in enumerate(client_manager.clients)],
+        options=list(client_options.values()),
         on_change=select_client,
         border_color=ft.colors.ON_SURFACE,
         border_width=1,
@@ -451,6 +353,11 @@ def main(page: ft.Page):
         
     )
 
+    # Search-as-you-type over name, CIF and e-mail, showing only the best matches
+    client_index = ClientSearchIndex()
+    client_search = ft.TextField(label="Search client (name, CIF, e-mail)", on_change=search_clients, prefix_icon=ft.icons.SEARCH, width=300, disabled=True)
+    client_results = ft.Column(spacing=0)
+
     client_fields = {field: ft.TextField(label=field, value=client_manager.current_client.get(field, '') if client_manager.current_client else '') for field in client_manager.fields}
 
     # Professional Data Tab Content
@@ -467,7 +374,20 @@ def main(page: ft.Page):
         on_click=lambda _: generate_invoice(include_invoice_number=True),
         style=ft.ButtonStyle(color= "white", bgcolor={"": "black"}, overlay_color=ft.cupertino_colors.ACTIVE_BLUE, side={ft.ControlState.DEFAULT: ft.BorderSide(1, ft.cupertino_colors.BLACK),ft.ControlState.HOVERED: ft.BorderSide(1, ft.cupertino_colors.ACTIVE_BLUE)})
     )
-    save_client_button = ft.ElevatedButton("Save Client", on_click=lambda _: client_manager.add_client({field: control.value for field, control in client_fields.items()}), style=ft.ButtonStyle(color= "white", bgcolor={"": "black"}, overlay_color=ft.cupertino_colors.ACTIVE_BLUE, side={ft.ControlState.DEFAULT: ft.BorderSide(1, ft.colors.BLACK),ft.ControlState.HOVERED: ft.BorderSide(1, ft.cupertino_colors.ACTIVE_BLUE)}))
+    render_progress = ft.ProgressBar(width=300, visible=False, color=ft.cupertino_colors.ACTIVE_BLUE)
+    render_status = ft.Text("", size=12)
+    cancel_render_button = ft.TextButton("Cancel", visible=False, on_click=lambda _: render_queue.cancel())
+    output_folder_picker = ft.FilePicker(on_result=choose_output_folder)
+    page.overlay.append(output_folder_picker)
+    output_folder_button = ft.IconButton(ft.icons.FOLDER_OPEN, tooltip=render_queue.output_folder, on_click=lambda _: output_folder_picker.get_directory_path(dialog_title="Save PDFs in"))
+    save_client_button = ft.ElevatedButton("Save Client", on_click=lambda _: save_client(), style=ft.ButtonStyle(color= "white", bgcolor={"": "black"}, overlay_color=ft.cupertino_colors.ACTIVE_BLUE, side={ft.ControlState.DEFAULT: ft.BorderSide(1, ft.colors.BLACK),ft.ControlState.HOVERED: ft.BorderSide(1, ft.cupertino_colors.ACTIVE_BLUE)}))
+    client_import_picker = ft.FilePicker(on_result=import_client_file)
+    client_export_picker = ft.FilePicker(on_result=export_client_file)
+    page.overlay.extend([client_import_picker, client_export_picker])
+    client_file_buttons = [
+        ft.IconButton(ft.icons.UPLOAD_FILE, tooltip="Import clients from CSV or JSONL", on_click=lambda _: client_import_picker.pick_files(allowed_extensions=["csv", "txt", "jsonl"])),
+        ft.IconButton(ft.icons.DOWNLOAD, tooltip="Export clients", on_click=lambda _: client_export_picker.save_file(file_name="clients.csv", allowed_extensions=["csv", "jsonl"])),
+    ]
     save_professional_button = ft.ElevatedButton("Save Professional Data", on_click=lambda _: save_professional_data(), style=ft.ButtonStyle(color= "white", bgcolor={"": "black"}, overlay_color=ft.cupertino_colors.ACTIVE_BLUE, side={ft.ControlState.DEFAULT: ft.BorderSide(1, ft.colors.BLACK),ft.ControlState.HOVERED: ft.BorderSide(1, ft.cupertino_colors.ACTIVE_BLUE)}))
 
 
@@ -480,7 +400,10 @@ def main(page: ft.Page):
         expand=True,
         content=ft.Column([
             trabajo_title,
+            new_concept_row,
+            catalogue_results,
             concept_rows,
+            bulk_concepts_row,
             ft.Row([
                 subtotal_text,
             ], alignment=ft.MainAxisAlignment.START),
@@ -491,7 +414,13 @@ def main(page: ft.Page):
             total_text,
             ft.Row([
             generate_budget_button,
-            generate_invoice_button],alignment=ft.MainAxisAlignment.CENTER)
+            generate_invoice_button,
+            output_folder_button],alignment=ft.MainAxisAlignment.CENTER),
+            ft.Row([
+                render_progress,
+                render_status,
+                cancel_render_button,
+            ], alignment=ft.MainAxisAlignment.CENTER)
         ], scroll=ft.ScrollMode.HIDDEN)
         )
     )
@@ -503,8 +432,10 @@ def main(page: ft.Page):
         margin=10,
         content=ft.Column([
             client_dropdown,
+            client_search,
+            client_results,
             *client_fields.values(),
-            save_client_button,
+            ft.Row([save_client_button, *client_file_buttons]),
         ], alignment=ft.MainAxisAlignment.START, spacing=10)
     ))
 
@@ -535,4 +466,11 @@ def main(page: ft.Page):
     )
     page.add(tabs)
 
-ft.app(target=main)
\ No newline at end of file
+    # Everything slow happens after the first frame: the catalogue and client
+    # list, and the PDF stack (WeasyPrint, templates, fonts) inside the render worker
+    threading.Thread(target=load_saved_data, daemon=True).start()
+    render_queue.prewarm()
+
+# The render worker is a separate process; keep it from starting another window
+if __name__ == "__main__":
+    ft.app(target=main)
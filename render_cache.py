@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+
+from template_registry import TEMPLATE_DIR
+
+CACHE_DIR = os.environ.get("PORSUPUESTAPP_CACHE_DIR", os.path.expanduser("~/.cache/porsupuestapp/pdf"))
+MAX_BYTES = 200 * 1024 * 1024
+
+
+def normalise(value):
+    # JSON-ready, order-independent form of the render inputs
+    if isinstance(value, dict):
+        return {str(key): normalise(item) for key, item in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [normalise(item) for item in value]
+    if isinstance(value, Decimal):
+        return str(value.normalize())
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(Decimal(repr(value)).normalize())
+    if hasattr(value, "__slots__"):
+        return [normalise(getattr(value, slot)) for slot in value.__slots__]
+    if hasattr(value, "__iter__") and not isinstance(value, str):
+        return [normalise(item) for item in value]
+    return value
+
+
+def layout_version(template_dir=TEMPLATE_DIR):
+    # Editing a template or stylesheet changes every key
+    stamps = []
+    for name in sorted(os.listdir(template_dir)):
+        path = os.path.join(template_dir, name)
+        stamps.append(f"{name}:{os.path.getmtime(path)}")
+    return "|".join(stamps)
+
+
+class RenderCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        # key -> size, least recently used first; recency survives restarts
+        # and is shared between processes through the files' mtimes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.scan()
+
+    def scan(self):
+        # The folder is the only record every process sees (the server and
+        # batch workers each have their own RenderCache on it), so the limit
+        # is enforced against what is on disk, not what this process wrote
+        entries = []
+        with os.scandir(self.directory) as listing:
+            for entry in listing:
+                if entry.name.endswith(".pdf"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        # Evicted by another process meanwhile
+                        continue
+                    entries.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        entries.sort()
+        self.entries = OrderedDict((key, size) for mtime, key, size in entries)
+        self.size = sum(self.entries.values())
+
+    def key(self, template_name, context, ignore=()):
+        inputs = {name: value for name, value in context.items() if name not in ignore}
+        payload = json.dumps([template_name, layout_version(), normalise(inputs)], separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+                self.size -= self.entries.pop(key, 0)
+            return None
+        with self.lock:
+            self.hits += 1
+            if key not in self.entries:
+                self.size += len(data)
+            self.entries[key] = len(data)
+            self.entries.move_to_end(key)
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        # Written under a temporary name and renamed, so readers never see half a PDF
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(data)
+        os.replace(temporary, self.path(key))
+        with self.lock:
+            # One directory listing per stored PDF, small next to rendering it
+            self.scan()
+            while self.size > self.max_bytes and self.entries:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.size -= old_size
+                self.evictions += 1
+                try:
+                    os.remove(self.path(old_key))
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        with self.lock:
+            for key in self.entries:
+                try:
+                    os.remove(self.path(key))
+                except FileNotFoundError:
+                    pass
+            self.entries.clear()
+            self.size = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.size,
+            }
+
+
+_cache = None
+
+
+def get_render_cache():
+    global _cache
+    if _cache is None:
+        _cache = RenderCache()
+    return _cache
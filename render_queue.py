@@ -0,0 +1,117 @@
+import itertools
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from batch import render_job, failed_result
+from renderer import warm
+
+
+class RenderQueue:
+    def __init__(self, output_folder, on_change=None, on_done=None):
+        self.output_folder = output_folder
+        self.on_change = on_change
+        self.on_done = on_done
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.running = None
+        self.cancelled = set()
+        self.ids = itertools.count(1)
+        self.executor = None
+        self.thread = None
+
+    @property
+    def busy(self):
+        return self.queued > 0
+
+    def submit(self, job):
+        job = dict(job)
+        job["id"] = job.get("id") or str(next(self.ids))
+        with self.lock:
+            self.queued += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        self.jobs.put(job)
+        self._notify()
+        return job["id"]
+
+    def cancel(self):
+        # Waiting jobs are dropped; a render already in the worker finishes
+        # but its result is thrown away
+        dropped = []
+        with self.lock:
+            while True:
+                try:
+                    dropped.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            self.queued -= len(dropped)
+            if self.running is not None:
+                self.cancelled.add(self.running)
+        for job in dropped:
+            self._finish(job, dict(failed_result(job, "Cancelled"), cancelled=True))
+        self._notify()
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=1)
+            return self.executor
+
+    def discard_executor(self, executor):
+        # A worker that died (out of memory, a crash in a native library)
+        # breaks its pool for good; the next render starts a new one
+        with self.lock:
+            if self.executor is executor:
+                self.executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def prewarm(self):
+        # Start the worker and load the PDF stack there while the user is
+        # still filling in the budget
+        self.get_executor().submit(warm)
+
+    def close(self):
+        self.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            with self.lock:
+                self.running = job["id"]
+            self._notify()
+            # One long-lived worker process keeps the renderer warm and
+            # renders strictly one document at a time
+            executor = self.get_executor()
+            try:
+                result = executor.submit(render_job, job, self.output_folder).result()
+            except BrokenProcessPool as e:
+                self.discard_executor(executor)
+                result = failed_result(job, f"Render process stopped: {e}")
+            except Exception as e:
+                result = failed_result(job, f"{type(e).__name__}: {e}")
+            with self.lock:
+                cancelled = job["id"] in self.cancelled
+                self.cancelled.discard(job["id"])
+                self.running = None
+                self.queued -= 1
+            if cancelled:
+                if result["filepath"] and os.path.exists(result["filepath"]):
+                    os.remove(result["filepath"])
+                result = dict(result, filepath=None, error="Cancelled", cancelled=True)
+            self._finish(job, result)
+            self._notify()
+
+    def _finish(self, job, result):
+        if self.on_done:
+            self.on_done(job, result)
+
+    def _notify(self):
+        if self.on_change:
+            self.on_change(self)
@@ -0,0 +1,90 @@
+import os
+from template_registry import TEMPLATE_DIR, get_template
+from instrumentation import span
+
+STYLESHEETS = [os.path.join(TEMPLATE_DIR, "invoice.css")]
+
+
+class InvoiceRenderer:
+    def __init__(self, stylesheets=None, base_url=TEMPLATE_DIR):
+        self.stylesheet_paths = list(STYLESHEETS if stylesheets is None else stylesheets)
+        self.base_url = base_url
+        # WeasyPrint (with Pango, cairo and fontTools behind it) is the slowest
+        # import in the app, so it is only loaded once something renders
+        from weasyprint.text.fonts import FontConfiguration
+        # Fonts resolved for one render are reused by every later one
+        self.font_config = FontConfiguration()
+        self.stylesheets = []
+        self._mtimes = None
+
+    def load_stylesheets(self):
+        mtimes = [os.path.getmtime(path) for path in self.stylesheet_paths]
+        if mtimes != self._mtimes:
+            from weasyprint import CSS
+            self.stylesheets = [CSS(filename=path, font_config=self.font_config) for path in self.stylesheet_paths]
+            self._mtimes = mtimes
+        return self.stylesheets
+
+    def layout(self, html):
+        # Parsing and layout are separate WeasyPrint steps so each one gets its own span
+        from weasyprint import HTML
+        with span("pdf.stylesheets"):
+            stylesheets = self.load_stylesheets()
+        with span("pdf.parse"):
+            document = HTML(string=html, base_url=self.base_url)
+        with span("pdf.layout"):
+            return document.render(stylesheets=stylesheets, font_config=self.font_config)
+
+    def render(self, html, target=None):
+        # Returns the PDF bytes when no target is given
+        rendered = self.layout(html)
+        with span("pdf.write", pages=len(rendered.pages)):
+            return rendered.write_pdf(target)
+
+    def render_chunks(self, chunk_html, count, first_size, size, target=None):
+        # Lays out a long table a chunk of rows at a time and writes all the
+        # pages as one PDF. Table layout cost grows much faster than the row
+        # count, so chunks keep layout time linear. Memory is not bounded: each
+        # chunk's DOM is dropped before the next one is built, but the laid-out
+        # pages of every chunk are held until the single write_pdf() at the
+        # end, so it grows with the page count. chunk_html(start, end) returns
+        # the document for rows [start, end), each row with id="row-N".
+        # Chunks are sized to run past a page: all of a chunk's pages but the
+        # last are kept, and the rows on that last page start the next chunk,
+        # so every page is filled as if the table had been laid out in one go.
+        first = None
+        pages = []
+        start = 0
+        while start < count:
+            end = min(start + (size if start else first_size), count)
+            rendered = self.layout(chunk_html(start, end))
+            if first is None:
+                first = rendered
+            kept = rendered.pages
+            if end < count and len(kept) > 1:
+                spilled = [int(name[4:]) for name in kept[-1].anchors if name.startswith("row-")]
+                if spilled and min(spilled) > start:
+                    kept = kept[:-1]
+                    end = min(spilled)
+            pages.extend(kept)
+            start = end
+        with span("pdf.write", pages=len(pages), chunks=True):
+            return first.copy(pages).write_pdf(target)
+
+
+_renderer = None
+
+
+def get_renderer():
+    global _renderer
+    if _renderer is None:
+        _renderer = InvoiceRenderer()
+    return _renderer
+
+
+def warm():
+    # Compile the templates, parse the stylesheet and load the fonts ahead of
+    # the first real render (run in a background thread or worker process)
+    get_template("invoice")
+    get_template("budget")
+    get_renderer().load_stylesheets()
@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException, Response
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from batch import render_job, release_number
+from billing import BillingCalculator, ProfessionalDataManager
+from client_store import SQLiteClientStore
+from renderer import warm
+
+WORKERS = int(os.environ.get("PORSUPUESTAPP_WORKERS", os.cpu_count() or 1))
+QUEUE_SIZE = int(os.environ.get("PORSUPUESTAPP_QUEUE_SIZE", 100))
+# Finished jobs (and their PDFs) kept around for GET /jobs/{id}/pdf
+KEEP_FINISHED = int(os.environ.get("PORSUPUESTAPP_KEEP_FINISHED", 500))
+
+
+class Client(BaseModel):
+    Name: str = Field(min_length=1)
+    Address: str = ""
+    CP: str = ""
+    Phone: str = ""
+    Email: str = ""
+    CIF: str = ""
+
+
+class Professional(BaseModel):
+    Name: str = Field(min_length=1)
+    Address: str = ""
+    CP: str = ""
+    CIF: str = ""
+    Phone: str = ""
+    Email: str = ""
+    Portfolio: str = ""
+    IBAN: str = ""
+    SWIFT: str = ""
+
+
+class Concept(BaseModel):
+    name: str = Field(min_length=1)
+    units: Decimal = Field(default=Decimal(0), ge=0)
+    price: Decimal = Decimal(0)
+
+
+class InvoiceRequest(BaseModel):
+    title: str = ""
+    invoice: bool = False
+    client: Optional[Client] = None
+    client_cif: Optional[str] = None
+    # Defaults to the saved professional data
+    professional: Optional[Professional] = None
+    concepts: List[Concept] = Field(min_length=1)
+    iva: Decimal = Field(default=Decimal(0), ge=0, le=100)
+    irpf: Decimal = Field(default=Decimal(0), ge=0, le=100)
+
+    @field_validator("concepts")
+    @classmethod
+    def unique_concepts(cls, concepts):
+        names = [concept.name for concept in concepts]
+        if len(names) != len(set(names)):
+            raise ValueError("Concept names must be unique")
+        return concepts
+
+    @model_validator(mode="after")
+    def has_client(self):
+        if self.client is None and not self.client_cif:
+            raise ValueError("Either client or client_cif is required")
+        return self
+
+
+class JobStatus(BaseModel):
+    id: str
+    status: str
+    invoice_number: str = ""
+    queued_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    seconds: Optional[float] = None
+    error: Optional[str] = None
+    queue_position: Optional[int] = None
+
+
+class RenderService:
+    def __init__(self, workers=WORKERS, queue_size=QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.executor = None
+        self.queue = None
+        self.dispatchers = []
+        self.jobs = OrderedDict()
+        self.waiting = []
+        self.numbering = BillingCalculator()
+        self.clients = None
+        self.professional = None
+
+    async def start(self):
+        self.clients = SQLiteClientStore()
+        self.professional = ProfessionalDataManager().data
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.dispatchers = [asyncio.create_task(self.dispatch()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self.dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.executor.shutdown(wait=True, cancel_futures=True)
+        self.clients.close()
+
+    def build_job(self, request):
+        if request.client is not None:
+            client = request.client.model_dump()
+        else:
+            client = self.clients.get_by_cif(request.client_cif)
+            if client is None:
+                raise HTTPException(status_code=422, detail=f"Unknown client CIF: {request.client_cif}")
+        professional = request.professional.model_dump() if request.professional else dict(self.professional)
+        return {
+            "id": uuid.uuid4().hex,
+            "title": request.title,
+            "invoice": request.invoice,
+            "iva": request.iva,
+            "irpf": request.irpf,
+            "concepts": [concept.model_dump() for concept in request.concepts],
+            "client": client,
+            "professional": professional,
+        }
+
+    async def submit(self, request):
+        if self.queue.full():
+            # Backpressure: callers are told to come back instead of queueing without limit
+            raise HTTPException(status_code=429, detail="Render queue is full", headers={"Retry-After": "1"})
+        # The client lookup and the numbering transaction wait on SQLite locks
+        # (other processes may be allocating), so they run off the event loop
+        loop = asyncio.get_running_loop()
+        job = await loop.run_in_executor(None, self.build_job, request)
+        if job["invoice"]:
+            job["invoice_number"] = await loop.run_in_executor(None, self.numbering.generate_invoice_number)
+        if self.queue.full():
+            # Filled up by other requests in the meantime
+            if job.get("invoice_number"):
+                await loop.run_in_executor(None, self.numbering.release_invoice_number, job["invoice_number"])
+            raise HTTPException(status_code=429, detail="Render queue is full", headers={"Retry-After": "1"})
+        state = {
+            "job": job,
+            "status": JobStatus(id=job["id"], status="queued", invoice_number=job.get("invoice_number", ""), queued_at=time.time()),
+            "pdf": None,
+            "filename": None,
+            "done": loop.create_future(),
+        }
+        self.jobs[job["id"]] = state
+        self.waiting.append(job["id"])
+        self.queue.put_nowait(job["id"])
+        return state
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id = await self.queue.get()
+            state = self.jobs[job_id]
+            self.waiting.remove(job_id)
+            status = state["status"]
+            status.status = "running"
+            status.started_at = time.time()
+            # A dead worker breaks the whole pool and every job in it: the
+            # pool is replaced and each of those jobs gets one more try
+            for _ in range(2):
+                executor = self.executor
+                try:
+                    result = await loop.run_in_executor(executor, render_job, state["job"])
+                except BrokenProcessPool as e:
+                    self.replace_executor(executor)
+                    result = {"error": f"Render process stopped: {e}"}
+                    continue
+                except Exception as e:
+                    result = {"error": f"{type(e).__name__}: {e}"}
+                break
+            status.finished_at = time.time()
+            status.seconds = round(status.finished_at - status.started_at, 4)
+            if result["error"]:
+                status.status = "failed"
+                status.error = result["error"]
+                await loop.run_in_executor(None, release_number, self.numbering, state["job"], result)
+            else:
+                status.status = "done"
+                state["filename"], state["pdf"] = result["filename"], result["pdf"]
+            state["done"].set_result(None)
+            self.queue.task_done()
+            self.forget_old_jobs()
+
+    def replace_executor(self, broken):
+        # Dispatchers that saw the same broken pool replace it only once
+        if self.executor is broken:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm)
+            broken.shutdown(wait=False, cancel_futures=True)
+
+    def forget_old_jobs(self):
+        finished = [job_id for job_id, state in self.jobs.items() if state["done"].done()]
+        for job_id in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id):
+        state = self.jobs.get(job_id)
+        if state is None:
+            raise HTTPException(status_code=404, detail="Unknown job")
+        status = state["status"]
+        status.queue_position = self.waiting.index(job_id) + 1 if job_id in self.waiting else None
+        return state
+
+
+def pdf_response(state):
+    return Response(
+        content=state["pdf"],
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'attachment; filename="{state["filename"]}"'},
+    )
+
+
+service = RenderService()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await service.start()
+    yield
+    await service.stop()
+
+
+app = FastAPI(title="Porsupuestapp", lifespan=lifespan)
+
+
+@app.post("/invoices", response_class=Response, responses={200: {"content": {"application/pdf": {}}}})
+async def render_invoice(request: InvoiceRequest):
+    # Waits for the render and returns the PDF directly
+    state = await service.submit(request)
+    await state["done"]
+    if state["status"].status == "failed":
+        raise HTTPException(status_code=500, detail=state["status"].error)
+    return pdf_response(state)
+
+
+@app.post("/jobs", status_code=202, response_model=JobStatus)
+async def create_job(request: InvoiceRequest):
+    return (await service.submit(request))["status"]
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def job_status(job_id: str):
+    return service.get(job_id)["status"]
+
+
+@app.get("/jobs/{job_id}/pdf", response_class=Response, responses={200: {"content": {"application/pdf": {}}}})
+async def job_pdf(job_id: str):
+    state = service.get(job_id)
+    if state["status"].status == "failed":
+        raise HTTPException(status_code=500, detail=state["status"].error)
+    if state["pdf"] is None:
+        raise HTTPException(status_code=409, detail=f"Job is {state['status'].status}", headers={"Retry-After": "1"})
+    return pdf_response(state)
+
+
+@app.get("/health")
+async def health():
+    return {
+        "workers": service.workers,
+        "queued": service.queue.qsize(),
+        "queue_size": service.queue_size,
+        "jobs": len(service.jobs),
+    }
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve invoice and budget rendering over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("-w", "--workers", type=int, default=WORKERS, help="render worker processes")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="jobs waiting before requests get 429")
+    args = parser.parse_args(argv)
+
+    service.workers = args.workers
+    service.queue_size = args.queue_size
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
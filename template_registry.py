@@ -0,0 +1,71 @@
+import os
+from instrumentation import span
+
+TEMPLATE_DIR = os.environ.get(
+    "PORSUPUESTAPP_TEMPLATES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates"),
+)
+
+# Logical name -> file in the template folder
+TEMPLATES = {
+    "invoice": "invoice.html",
+    "budget": "budget.html",
+}
+
+
+class TemplateRegistry:
+    def __init__(self, template_dir=TEMPLATE_DIR, templates=None, bytecode_cache=True, cache_dir=None):
+        self.template_dir = template_dir
+        self.templates = dict(TEMPLATES if templates is None else templates)
+        self.bytecode_cache = bytecode_cache
+        # None lets Jinja pick its per-user folder in the temp directory
+        self.cache_dir = cache_dir
+        self._env = None
+
+    @property
+    def env(self):
+        # Built on first use; auto_reload makes Jinja compare the template
+        # file's mtime on every lookup and recompile it when it changed
+        if self._env is None:
+            # Imported here so that starting the app does not pay for Jinja
+            from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+            cache = None
+            if self.bytecode_cache:
+                if self.cache_dir:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                cache = FileSystemBytecodeCache(self.cache_dir)
+            self._env = Environment(
+                loader=FileSystemLoader(self.template_dir),
+                bytecode_cache=cache,
+                auto_reload=True,
+                cache_size=50,
+            )
+        return self._env
+
+    def register(self, name, filename):
+        self.templates[name] = filename
+
+    def get(self, name):
+        # Includes the mtime check and, on the first call or after an edit, compilation
+        with span("template.compile", template=name):
+            return self.env.get_template(self.templates.get(name, name))
+
+    def clear(self):
+        if self._env is not None:
+            self._env.cache.clear()
+            if self._env.bytecode_cache is not None:
+                self._env.bytecode_cache.clear()
+
+
+_registry = None
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        _registry = TemplateRegistry()
+    return _registry
+
+
+def get_template(name):
+    return get_registry().get(name)
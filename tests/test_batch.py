@@ -0,0 +1,27 @@
+import pytest
+
+from batch import load_jsonl_manifest, prepare_job
+from client_store import SQLiteClientStore
+
+
+def test_manifest_cif_is_matched_however_it_is_written(tmp_path):
+    store = SQLiteClientStore(str(tmp_path / "clients.sqlite3"))
+    store.save({"Name": "Acme", "CIF": "b-12.345 678"})
+    clients_by_cif = {client["CIF"]: client for client in store.all()}
+    for cif in ("B-12345678", "b12345678", " B 12.345.678 "):
+        job = prepare_job({"id": "1", "client_cif": cif, "invoice": True}, {}, clients_by_cif)
+        assert job["client"]["Name"] == "Acme"
+    with pytest.raises(ValueError):
+        prepare_job({"id": "2", "client_cif": "X999", "invoice": True}, {}, clients_by_cif)
+    store.close()
+
+
+def test_malformed_manifest_lines_fail_on_their_own(tmp_path):
+    manifest = tmp_path / "jobs.jsonl"
+    manifest.write_text('{"id": "ok", "client": {"Name": "Acme"}}\n{"id": "broken"\n\n[1, 2]\n', encoding="utf-8")
+    jobs = load_jsonl_manifest(str(manifest))
+    assert [job["id"] for job in jobs] == ["ok", "2", "4"]
+    assert prepare_job(jobs[0], {}, {})["client"]["Name"] == "Acme"
+    for job in jobs[1:]:
+        with pytest.raises(ValueError, match=f"Line {job['id']}"):
+            prepare_job(job, {}, {})
@@ -0,0 +1,36 @@
+import pytest
+
+from billing import ClientDataManager
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return ClientDataManager()
+
+
+def test_clients_stay_sorted_by_name(manager):
+    zed = manager.add_client({"Name": "Zed", "CIF": "B1"})
+    manager.add_client({"Name": "ana", "CIF": "B2"})
+    manager.update_client(zed["id"], {"Name": "Bea", "CIF": "B1"})
+    assert [client["Name"] for client in manager.sorted_clients] == ["ana", "Bea"]
+    assert manager.delete_client(zed["id"]) and not manager.delete_client(zed["id"])
+    assert [client["Name"] for client in manager.sorted_clients] == ["ana"]
+
+
+def test_saving_by_a_known_cif_updates_that_client(manager):
+    first = manager.add_client({"Name": "Acme", "CIF": "B-12345678"})
+    second = manager.add_client({"Name": "Acme S.L.", "CIF": "b12345678"})
+    assert first["id"] == second["id"] and len(manager.clients) == 1
+
+
+def test_unknown_id_and_taken_cif_are_value_errors(manager):
+    acme = manager.add_client({"Name": "Acme", "CIF": "B1"})
+    other = manager.add_client({"Name": "Other", "CIF": "B2"})
+    with pytest.raises(ValueError, match="No client"):
+        manager.update_client(999, {"Name": "Ghost"})
+    with pytest.raises(ValueError, match="already belongs"):
+        manager.update_client(other["id"], {"Name": "Other", "CIF": "B1"})
+    assert manager.select_client(other["id"])["CIF"] == "B2"
+    assert [client["Name"] for client in manager.sorted_clients] == ["Acme", "Other"]
+    assert manager.clients_by_id[acme["id"]]["CIF"] == "B1"
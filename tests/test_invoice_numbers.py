@@ -0,0 +1,59 @@
+import json
+import logging
+from datetime import datetime
+
+import pytest
+
+from invoice_numbers import InvoiceNumberAllocator
+
+
+@pytest.fixture
+def allocator(tmp_path):
+    return InvoiceNumberAllocator(str(tmp_path / "counter.sqlite3"), str(tmp_path / "counter.json"))
+
+
+def test_reserve_is_sequential_per_year(allocator):
+    assert allocator.reserve(3, year=2024) == ["2024-001", "2024-002", "2024-003"]
+    assert allocator.allocate(year=2024) == "2024-004"
+    assert allocator.allocate(year=2025) == "2025-001"
+
+
+def test_older_released_numbers_are_voided_not_reused(allocator):
+    # 002 failed after 003 was issued: handing it out again would put it
+    # after 003 in date order
+    allocator.reserve(5, year=2024)
+    allocator.release("2024-004")
+    allocator.release("2024-002")
+    assert allocator.reserve(2, year=2024) == ["2024-006", "2024-007"]
+    assert allocator.voided(2024) == ["2024-002", "2024-004"]
+
+
+def test_releasing_the_newest_number_rolls_the_counter_back(allocator):
+    allocator.reserve(4, year=2024)
+    allocator.release("2024-003")
+    allocator.release("2024-004")
+    # 003 was voided, but with 004 gone nothing after it was issued
+    assert allocator.voided(2024) == []
+    assert allocator.allocate(year=2024) == "2024-003"
+    allocator.release("2024-009")
+    assert allocator.allocate(year=2024) == "2024-004"
+
+
+def test_legacy_counter_is_migrated_once(tmp_path):
+    legacy = tmp_path / "counter.json"
+    legacy.write_text(json.dumps({"year": 2024, "counter": 41}))
+    db = str(tmp_path / "counter.sqlite3")
+    assert InvoiceNumberAllocator(db, str(legacy)).allocate(year=2024) == "2024-042"
+    legacy.write_text(json.dumps({"year": 2024, "counter": 7}))
+    assert InvoiceNumberAllocator(db, str(legacy)).allocate(year=2024) == "2024-043"
+
+
+@pytest.mark.parametrize("content", ["", "{\"year\": 2024", "[]", "{\"year\": 2024}"])
+def test_unreadable_legacy_counter_is_no_counter(tmp_path, caplog, content):
+    legacy = tmp_path / "counter.json"
+    legacy.write_text(content)
+    with caplog.at_level(logging.WARNING, logger="porsupuestapp.numbering"):
+        allocator = InvoiceNumberAllocator(str(tmp_path / "counter.sqlite3"), str(legacy))
+    assert "Ignoring unreadable invoice counter" in caplog.text
+    year = datetime.now().year
+    assert allocator.allocate() == f"{year}-001"
@@ -0,0 +1,53 @@
+import pytest
+
+import batch
+from billing import BillingCalculator
+
+PROFESSIONAL = {"Name": "Estudio", "CIF": "12345678Z"}
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # BillingCalculator keeps its ledger and counter next to the app
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(BillingCalculator, "render_pdf", lambda self, template_name, context, cacheable=False: b"%PDF")
+    return tmp_path
+
+
+def job(number, client=None):
+    return {
+        "id": number, "title": "Web", "iva": 21, "irpf": 0, "invoice": True, "invoice_number": number,
+        "concepts": [{"name": "Design", "units": 2, "price": 30}],
+        "professional": PROFESSIONAL, "client": client or {"Name": "Acme", "CIF": "B12345678"},
+    }
+
+
+def test_failed_delivery_forgets_only_its_own_document(workdir):
+    numbering = BillingCalculator()
+    number = numbering.generate_invoice_number()
+    result = batch.render_job(job(number), output_folder=str(workdir / "missing" / "\0"))
+    assert result["error"] and result["document_id"]
+    assert numbering.ledger.get(number) is not None
+    batch.release_number(numbering, job(number), result)
+    assert numbering.ledger.get(number) is None
+    assert numbering.generate_invoice_number() == number
+
+
+def test_number_already_in_the_ledger_is_never_released(workdir):
+    numbering = BillingCalculator()
+    number = numbering.generate_invoice_number()
+    assert batch.render_job(job(number))["error"] is None
+    # The allocator lags the ledger (e.g. its database was reset) and hands
+    # out the same number again
+    result = batch.render_job(job(number, {"Name": "Other"}))
+    assert result["error"].startswith("LedgerError") and result["number_spent"]
+    batch.release_number(numbering, job(number), result)
+    assert numbering.ledger.get(number)["client"]["Name"] == "Acme"
+
+
+
+def test_cif_spellings_are_one_client(workdir):
+    for number, cif in (("2026-001", "B-1234.5678"), ("2026-002", "b12345678")):
+        assert batch.render_job(job(number, {"Name": "Acme", "CIF": cif}))["error"] is None
+    rows = BillingCalculator().ledger.revenue_by_client()
+    assert [(row["client_cif"], row["documents"]) for row in rows] == [("B12345678", 2)]
@@ -0,0 +1,67 @@
+from decimal import Decimal
+
+import pytest
+
+from line_items import LineItems, money, parse_concepts, quantity, tax_amount, to_decimal
+
+
+def test_amounts_round_half_up_to_the_cent():
+    assert money("0.005") == Decimal("0.01")
+    assert money("2,675") == Decimal("2.68")
+    assert money(1.005) == Decimal("1.01")
+    assert quantity("1.5") == Decimal("1.5")
+    assert quantity("1.005") == Decimal("1.01")
+
+
+@pytest.mark.parametrize("value", ["nan", "inf", "-Infinity", "sNaN", float("nan"), Decimal("NaN"), "abc"])
+def test_non_numbers_are_rejected(value):
+    with pytest.raises(ValueError):
+        to_decimal(value)
+
+
+def test_amounts_too_large_for_cents_are_rejected():
+    with pytest.raises(ValueError):
+        money("1e40")
+
+
+def test_line_totals_and_running_subtotal():
+    lines = LineItems()
+    lines.add("Design", "3", "33.333")
+    lines.add("Hosting", "1.5", "10")
+    assert lines.get("Design").total == Decimal("99.99")
+    assert lines.subtotal() == Decimal("114.99")
+    lines.set("Hosting", "2", "10")
+    assert lines.subtotal() == Decimal("119.99")
+    lines.remove("Design")
+    assert lines.subtotal() == lines.recalculate() == Decimal("20.00")
+    with pytest.raises(ValueError):
+        lines.add("Hosting")
+
+
+def test_invalid_set_leaves_the_line_untouched():
+    lines = LineItems()
+    lines.add("Design", 1, 2)
+    with pytest.raises(ValueError):
+        lines.set("Design", "1e30", "1e10")
+    assert lines.get("Design").total == lines.subtotal() == Decimal("2.00")
+
+
+def test_tax_is_rounded_once_per_tax():
+    assert tax_amount(Decimal("10.05"), 21) == Decimal("2.11")
+    assert tax_amount(Decimal("0.02"), "21") == Decimal("0.00")
+    assert tax_amount(Decimal("100.00"), "15,5") == Decimal("15.50")
+    assert tax_amount(Decimal("100.00"), 0) == Decimal("0.00")
+
+
+def test_parse_concepts_reports_bad_lines():
+    rows, errors = parse_concepts("concept;units;price\nDesign;2;30\nx;nan;1\n;1;1")
+    assert rows == [("Design", Decimal("2"), Decimal("30.00"))]
+    assert [line_number for line_number, _ in errors] == [3, 4]
+
+
+def test_unparsable_first_line_is_an_error_unless_it_is_a_header():
+    rows, errors = parse_concepts("Design;abc;30\nHosting;1;10")
+    assert rows == [("Hosting", Decimal("1"), Decimal("10.00"))]
+    assert [line_number for line_number, _ in errors] == [1]
+    rows, errors = parse_concepts("Name\tUnits\tPrice\nHosting\t1\t10")
+    assert len(rows) == 1 and errors == []
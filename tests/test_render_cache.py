@@ -0,0 +1,42 @@
+import os
+from decimal import Decimal
+
+from render_cache import RenderCache
+
+
+def age(cache, key, seconds):
+    os.utime(cache.path(key), (seconds, seconds))
+
+
+def test_key_ignores_order_number_spelling_and_ignored_fields(tmp_path):
+    cache = RenderCache(str(tmp_path))
+    context = {"iva": Decimal("21.00"), "irpf": 15, "current_date": "01/01/2024", "client_data": {"Name": "Acme", "CIF": "B1"}}
+    same = {"client_data": {"CIF": "B1", "Name": "Acme"}, "irpf": 15.0, "iva": 21, "current_date": "02/02/2025"}
+    assert cache.key("budget", context, ignore=("current_date",)) == cache.key("budget", same, ignore=("current_date",))
+    assert cache.key("budget", context) != cache.key("budget", same)
+    assert cache.key("budget", context, ignore=("current_date",)) != cache.key("invoice", context, ignore=("current_date",))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = RenderCache(str(tmp_path), max_bytes=25)
+    cache.put("a", b"x" * 10)
+    cache.put("b", b"x" * 10)
+    age(cache, "a", 1000)
+    age(cache, "b", 2000)
+    assert cache.get("a") == b"x" * 10
+    cache.put("c", b"x" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.stats() == {"hits": 3, "misses": 1, "hit_rate": 0.75, "evictions": 1, "entries": 2, "bytes": 20}
+
+
+def test_limit_holds_across_processes_sharing_the_folder(tmp_path):
+    first = RenderCache(str(tmp_path), max_bytes=25)
+    second = RenderCache(str(tmp_path), max_bytes=25)
+    first.put("a", b"x" * 10)
+    age(first, "a", 1000)
+    second.put("b", b"x" * 10)
+    age(second, "b", 2000)
+    first.put("c", b"x" * 10)
+    assert sorted(name for name in os.listdir(tmp_path)) == ["b.pdf", "c.pdf"]
+    assert second.get("a") is None
@@ -0,0 +1,29 @@
+import os
+import threading
+
+import render_queue
+from batch import failed_result
+
+
+def render_or_crash(job, output_folder):
+    if job.get("crash"):
+        os._exit(1)
+    return failed_result(job, None)
+
+
+def test_queue_recovers_from_a_dead_worker(monkeypatch, tmp_path):
+    monkeypatch.setattr(render_queue, "render_job", render_or_crash)
+    results = []
+    finished = threading.Event()
+
+    def done(job, result):
+        results.append(result["error"])
+        if len(results) == 2:
+            finished.set()
+
+    queue = render_queue.RenderQueue(str(tmp_path), on_done=done)
+    queue.submit({"crash": True})
+    queue.submit({})
+    assert finished.wait(30)
+    queue.close()
+    assert results[0].startswith("Render process stopped") and results[1] is None
@@ -0,0 +1,42 @@
+import pytest
+
+from renderer import InvoiceRenderer
+
+
+class FakePage:
+    def __init__(self, rows):
+        self.rows = rows
+        self.anchors = {f"row-{row}": (0, 0) for row in rows}
+
+
+class FakeDocument:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def copy(self, pages):
+        return FakeDocument(pages)
+
+    def write_pdf(self, target=None):
+        return self.pages
+
+
+def fake_layout(self, html):
+    # 20 rows fit under the header on the first page, 33 on the others
+    first, rows = html
+    pages, capacity, page = [], 20 if first else 33, []
+    for row in rows:
+        if len(page) == capacity:
+            pages.append(FakePage(page))
+            capacity, page = 33, []
+        page.append(row)
+    pages.append(FakePage(page))
+    return FakeDocument(pages)
+
+
+@pytest.mark.parametrize("count", [26, 100, 1000])
+def test_chunks_flow_into_full_pages(monkeypatch, count):
+    monkeypatch.setattr(InvoiceRenderer, "layout", fake_layout)
+    renderer = InvoiceRenderer.__new__(InvoiceRenderer)
+    pages = renderer.render_chunks(lambda start, end: (start == 0, list(range(start, end))), count, 25, 45)
+    assert [row for page in pages for row in page.rows] == list(range(count))
+    assert [len(page.rows) for page in pages[:-1]] == [20] + [33] * (len(pages) - 2)
@@ -0,0 +1,38 @@
+from catalogue import Catalogue
+from client_search import ClientSearchIndex, PrefixIndex
+
+
+def test_prefix_index_add_remove_and_match():
+    index = PrefixIndex()
+    index.build([("diseno", 1), ("web", 1), ("web", 2)])
+    index.add(3, {"website", "hosting"})
+    assert index.matches("web") == {1, 2, 3}
+    assert index.matches("dis") == {1}
+    index.remove(1, {"diseno", "web"})
+    assert index.matches("web") == {2, 3}
+    assert index.matches("dis") == set()
+
+
+def test_client_search_by_any_field_prefix():
+    index = ClientSearchIndex()
+    index.build([
+        (1, {"Name": "Ana Peña", "CIF": "B12345678", "Email": "ana@acme.es"}),
+        (2, {"Name": "Pedro Ávila", "CIF": "", "Email": ""}),
+    ])
+    assert index.search("pe") == [2, 1]
+    assert index.search("b1234") == [1]
+    index.add(3, {"Name": "Peña Estudio", "CIF": "", "Email": ""})
+    index.remove(1)
+    assert index.search("pena") == [3]
+
+
+def test_catalogue_matches_every_word_in_any_order(tmp_path):
+    catalogue = Catalogue(str(tmp_path / "catalogue.sqlite3"))
+    design = catalogue.save({"name": "Diseño web", "price": "300"})
+    catalogue.save({"name": "Hosting web", "price": "10"})
+    assert [service["name"] for service in catalogue.search("web dis")] == ["Diseño web"]
+    catalogue.used(design["id"])
+    assert [service["name"] for service in catalogue.search("web")] == ["Diseño web", "Hosting web"]
+    catalogue.delete(design["id"])
+    assert [service["name"] for service in catalogue.search("web")] == ["Hosting web"]
+    catalogue.close()